@@ -3,7 +3,8 @@
 # =============================================================================
 
 from flask import Flask, render_template, request, jsonify
-from models import db, User, Todo, init_db
+from sqlalchemy.exc import IntegrityError
+from models import db, User, Todo, init_db, find_registration_conflict, registration_error_message
 from auth import hash_password, verify_password, create_token
 
 app = Flask(__name__)
@@ -55,8 +56,10 @@ def api_register():
     if not username or not email or not password:
         return jsonify({'error': 'All fields required'}), 400
 
-    if User.query.filter_by(email=email).first():
-        return jsonify({'error': 'Email already registered'}), 400
+    # ONE cheap query checks email AND username, before the expensive hashing
+    conflict = find_registration_conflict(username, email)
+    if conflict:
+        return jsonify({'error': conflict}), 400
 
     new_user = User(
         username=username,
@@ -64,7 +67,11 @@ def api_register():
         password_hash=hash_password(password)
     )
     db.session.add(new_user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError as e:  # Someone took the name a moment ago
+        db.session.rollback()
+        return jsonify({'error': registration_error_message(e)}), 400
 
     return jsonify({'message': 'Registration successful!'}), 201
 
@@ -78,7 +85,8 @@ def api_login():
     email = data.get('email')
     password = data.get('password')
 
-    user = User.query.filter_by(email=email).first()
+    # Emails are case-insensitive (same as registration; uses ix_users_email_lower)
+    user = User.query.filter(db.func.lower(User.email) == (email or '').lower()).first()
     if not user or not verify_password(user.password_hash, password):
         return jsonify({'error': 'Invalid credentials'}), 401
 
@@ -3,6 +3,7 @@
 # =============================================================================
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
 
 db = SQLAlchemy()
 
@@ -16,6 +17,12 @@ class User(db.Model):
     password_hash = db.Column(db.String(256), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
 
+    # Case-insensitive uniqueness: "Alice" and "alice" are the same user
+    __table_args__ = (
+        db.Index('ix_users_email_lower', db.func.lower(email), unique=True),
+        db.Index('ix_users_username_lower', db.func.lower(username), unique=True),
+    )
+
     todos = db.relationship('Todo', backref='owner', lazy=True)
 
 
@@ -34,3 +41,49 @@ def init_db(app):
     db.init_app(app)
     with app.app_context():
         db.create_all()
+        create_user_indexes(db.engine)
+
+
+# =============================================================================
+# REGISTRATION HELPERS
+# =============================================================================
+
+# ONE cheap query checks both email and username (case-insensitive), so we
+# never spend CPU on hashing a password for a duplicate registration.
+def find_registration_conflict(username, email):
+    taken = User.query.filter(db.or_(
+        db.func.lower(User.email) == email.lower(),
+        db.func.lower(User.username) == username.lower()
+    )).first()
+    if taken is None:
+        return None
+    if taken.email.lower() == email.lower():
+        return 'Email already registered'
+    return 'Username already taken'
+
+
+# If two people register at the same moment, the unique indexes stop the
+# second INSERT. This turns that IntegrityError into the usual message.
+def registration_error_message(error):
+    if 'email' in str(error.orig):
+        return 'Email already registered'
+    return 'Username already taken'
+
+
+# db.create_all() only creates missing TABLES: a database file from before
+# the lower() indexes existed doesn't have them, and would only catch
+# exact-case duplicates. This adds them (IF NOT EXISTS: cheap on every start).
+USER_INDEXES_SQL = [
+    'CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email_lower ON users (lower(email))',
+    'CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username_lower ON users (lower(username))',
+]
+
+
+def create_user_indexes(engine):
+    for sql in USER_INDEXES_SQL:
+        try:
+            with engine.begin() as conn:
+                conn.exec_driver_sql(sql)
+        except IntegrityError:
+            # Two existing users differ only in case: fix them by hand
+            print(f'Could not create a unique index, duplicate users exist: {sql}')
@@ -0,0 +1,214 @@
+# =============================================================================
+# Part 7: Admin User List (paging, search, sorting)
+# =============================================================================
+# GET /api/admin/users used to return every user, with every user's todos
+# loaded to count them. Now it returns one page at a time:
+#
+#   GET /api/admin/users?q=ali&match=prefix&sort=todos&order=desc&limit=50
+#   -> {"users": [...], "next_cursor": "12|42"}
+#   GET /api/admin/users?...&after=12|42        the next page
+#
+#   q       search username and email (match=prefix uses an index,
+#           match=contains scans the users table - still no todos read)
+#   sort    created_at | todos | completion
+#   order   desc (default) | asc
+#
+# Paging is "keyset" paging: the cursor is the sort value and id of the last
+# user on the page, and the next page starts right after it. Every sort has
+# an index on (value, id), so page 1000 costs the same as page 1.
+# Each shard returns its best limit + 1 users; we merge them.
+#
+# Counting todos per user for every page would be slow, so users carry
+# total_todos / completed_todos counters. SQLite TRIGGERS on todos and
+# todos_archive keep them correct, whichever code changes a todo.
+
+from datetime import datetime
+
+from flask import jsonify
+
+from sharding import all_shard_keys, fan_out
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+SORTS = ('created_at', 'todos', 'completion')
+
+# Live (not trashed) todos count; archived todos count as completed
+COUNTER_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_count_insert AFTER INSERT ON todos
+    WHEN NEW.deleted_at IS NULL
+    BEGIN
+        UPDATE users SET total_todos = total_todos + 1,
+                         completed_todos = completed_todos + COALESCE(NEW.is_completed, 0)
+        WHERE id = NEW.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_count_delete AFTER DELETE ON todos
+    WHEN OLD.deleted_at IS NULL
+    BEGIN
+        UPDATE users SET total_todos = total_todos - 1,
+                         completed_todos = completed_todos - COALESCE(OLD.is_completed, 0)
+        WHERE id = OLD.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_count_update
+    AFTER UPDATE OF is_completed, deleted_at, user_id ON todos
+    BEGIN
+        UPDATE users SET total_todos = total_todos - 1,
+                         completed_todos = completed_todos - COALESCE(OLD.is_completed, 0)
+        WHERE id = OLD.user_id AND OLD.deleted_at IS NULL;
+        UPDATE users SET total_todos = total_todos + 1,
+                         completed_todos = completed_todos + COALESCE(NEW.is_completed, 0)
+        WHERE id = NEW.user_id AND NEW.deleted_at IS NULL;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_archive_count_insert AFTER INSERT ON todos_archive
+    BEGIN
+        UPDATE users SET total_todos = total_todos + 1, completed_todos = completed_todos + 1
+        WHERE id = NEW.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_archive_count_delete AFTER DELETE ON todos_archive
+    BEGIN
+        UPDATE users SET total_todos = total_todos - 1, completed_todos = completed_todos - 1
+        WHERE id = OLD.user_id;
+    END
+    """,
+]
+
+# Sets the counters from scratch (for databases created before the triggers)
+BACKFILL_COUNTERS = """
+    UPDATE users SET
+        total_todos =
+            (SELECT COUNT(*) FROM todos WHERE user_id = users.id AND deleted_at IS NULL)
+          + (SELECT COUNT(*) FROM todos_archive WHERE user_id = users.id),
+        completed_todos =
+            (SELECT COUNT(*) FROM todos WHERE user_id = users.id AND deleted_at IS NULL AND is_completed)
+          + (SELECT COUNT(*) FROM todos_archive WHERE user_id = users.id)
+"""
+
+
+def install_todo_counters(db):
+    """Creates the counter triggers on every shard (backfilling the first time)."""
+    for key in all_shard_keys():
+        with db.engines[key].begin() as conn:
+            existing = conn.exec_driver_sql(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'todos%count%'"
+            ).scalar()
+            for trigger in COUNTER_TRIGGERS:
+                conn.exec_driver_sql(trigger)
+            if existing < len(COUNTER_TRIGGERS):
+                conn.exec_driver_sql(BACKFILL_COUNTERS)
+
+
+# =============================================================================
+# READING THE QUERY STRING
+# =============================================================================
+
+def _sort_column(sort):
+    from models import db, User, COMPLETION_RATE_SQL
+
+    return {
+        'created_at': User.created_at,
+        'todos': User.total_todos,
+        'completion': db.literal_column(f'({COMPLETION_RATE_SQL})'),
+    }[sort]
+
+
+def _parse_cursor_value(sort, text):
+    if sort == 'created_at':
+        return datetime.fromisoformat(text)
+    if sort == 'todos':
+        return int(text)
+    return float(text)
+
+
+def parse_user_query(args):
+    """
+    Reads ?q=&match=&sort=&order=&limit=&after= from the query string.
+    Returns: (options, None) on success, (None, error_response) on failure
+    """
+    sort = args.get('sort', 'created_at')
+    if sort not in SORTS:
+        return None, (jsonify({'error': f"sort must be one of: {', '.join(SORTS)}"}), 400)
+
+    options = {
+        'q': args.get('q', '').strip().lower(),
+        'match': 'contains' if args.get('match') == 'contains' else 'prefix',
+        'sort': sort,
+        'descending': args.get('order', 'desc') != 'asc',
+        'limit': max(1, min(args.get('limit', DEFAULT_LIMIT, type=int), MAX_LIMIT)),
+        'after': None,
+    }
+
+    if args.get('after'):
+        value, _, last_id = args['after'].rpartition('|')
+        try:
+            options['after'] = (_parse_cursor_value(sort, value), int(last_id))
+        except ValueError:
+            return None, (jsonify({'error': 'Invalid cursor'}), 400)
+
+    return options, None
+
+
+# =============================================================================
+# THE QUERY
+# =============================================================================
+
+def _search_filter(q, match):
+    from models import db, User
+
+    columns = [db.func.lower(User.username), db.func.lower(User.email)]
+    if match == 'contains':
+        return db.or_(*[db.func.instr(column, q) > 0 for column in columns])
+
+    # 'ali' -> lower(x) >= 'ali' AND lower(x) < 'alj': a range on the index
+    upper = q[:-1] + chr(ord(q[-1]) + 1)
+    return db.or_(*[(column >= q) & (column < upper) for column in columns])
+
+
+def _page_from_shard(options):
+    from models import db, User
+
+    sort_column = _sort_column(options['sort'])
+    query = User.query.add_columns(sort_column.label('sort_value'))
+
+    if options['q']:
+        query = query.filter(_search_filter(options['q'], options['match']))
+    if options['after']:
+        # (value, id) < (v, last_id), spelled out so SQLite can use a range
+        # on the index (it can't for a row value on an expression index)
+        value, last_id = options['after']
+        if options['descending']:
+            query = query.filter(sort_column <= value, db.or_(sort_column < value, User.id < last_id))
+        else:
+            query = query.filter(sort_column >= value, db.or_(sort_column > value, User.id > last_id))
+
+    if options['descending']:
+        query = query.order_by(sort_column.desc(), User.id.desc())
+    else:
+        query = query.order_by(sort_column, User.id)
+
+    # One extra row tells us whether there is a next page
+    rows = query.limit(options['limit'] + 1).all()
+    return [(sort_value, user.id, user.to_dict_with_stats()) for user, sort_value in rows]
+
+
+def search_users(options):
+    """Returns one page of users from all shards: {'users': [...], 'next_cursor': ...}"""
+    rows = [row for shard_rows in fan_out(lambda: _page_from_shard(options)) for row in shard_rows]
+    rows.sort(key=lambda row: (row[0], row[1]), reverse=options['descending'])
+
+    page = rows[:options['limit']]
+    next_cursor = None
+    if len(rows) > options['limit']:
+        sort_value, user_id, _ = page[-1]
+        if isinstance(sort_value, datetime):
+            sort_value = sort_value.isoformat()
+        next_cursor = f'{sort_value}|{user_id}'
+
+    return {'users': [user for _, _, user in page], 'next_cursor': next_cursor}
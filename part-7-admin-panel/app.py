@@ -2,22 +2,65 @@
 # Part 7: Admin Panel
 # =============================================================================
 
-from flask import Flask, request, jsonify, render_template
-from models import db, User, Todo
-from auth import hash_password, verify_password, create_token, get_current_user, get_admin_user
+import os
+import threading
+from datetime import datetime
+from flask import Flask, request, jsonify
+from sqlalchemy.exc import IntegrityError
+from models import db, User, Todo, ArchivedTodo, UserDirectory, find_registration_conflict, registration_error_message
+from models import OPEN_DUE_TODOS_SQL
+from auth import hash_password, verify_password, create_token, get_current_user, get_admin_user, ACCESS_TOKEN_MINUTES
+from sharding import configure_shards, create_shard_tables, backfill_directory, register_in_directory, use_shard, fan_out
+from compression import compress_response
+from page_cache import PageCache, enable_template_bytecode_cache
+from purge import resume_purges, schedule_purge, get_purge_status
+from maintenance import start_maintenance_scheduler, start_maintenance, get_maintenance_status
+from metrics import init_metrics
+from rate_limit import init_rate_limiter
+from profiler import init_profiler
+from slow_queries import slow_query_report
+from todo_import import import_todos
+from export import export_response, user_todo_rows, all_user_rows, all_todo_rows, parse_admin_cursor
+from export import TODO_FIELDS, USER_FIELDS, ADMIN_TODO_FIELDS
+from backup import start_backup_scheduler, start_backup, get_backup_status
+from todo_cache import init_todo_cache, cached_todos_response, invalidate_todos
+from batch import batch_response
+from admin_users import install_todo_counters, parse_user_query, search_users
+from refresh_tokens import issue_refresh_token, rotate_refresh_token, revoke_refresh_token, revoke_user_tokens
+from jobs import init_jobs, start_job_workers, list_jobs, get_queue_status, retry_job
+from reminders import parse_due_at, schedule_reminder, on_reminder, start_reminder_scheduler
+from ranking import rank_for_new_todo, move_todo, schedule_rebalance, rank_unranked_todos
+from subtasks import find_parent, roll_up, trash_subtree, restore_subtree, get_tree
+from sharing import check_todo_access, use_list_shard, create_list, get_user_lists, list_role
+from sharing import get_members, add_member, remove_member, list_todos, shared_todos
+from tags import install_tag_counters, parse_tags, parse_tag_filter, set_todo_tags, filter_by_tags, get_user_tags
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///todo_part7.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+configure_shards(app)  # Extra shard databases + user directory (see sharding.py)
 
 db.init_app(app)
+app.after_request(compress_response)  # gzip/br/zstd for large JSON responses
+enable_template_bytecode_cache(app)   # Compiled templates survive restarts
+init_metrics(app)                     # Prometheus metrics at /metrics
+init_rate_limiter(app)                # 429 Too Many Requests (see rate_limit.py)
+init_profiler(app)                    # Admins: add ?profile=1 to any request
+init_todo_cache(app)                  # Cached GET /api/todos (see todo_cache.py)
+init_jobs(app)                        # Durable background job queue (see jobs.py)
 
 with app.app_context():
-    db.create_all()
+    create_shard_tables(db)
+    install_todo_counters(db)  # Per-user todo counts for the admin user list
+    install_tag_counters(db)   # Per-tag todo counts for the tag sidebar
+    backfill_directory()
 
-    admin = User.query.filter_by(email='admin@example.com').first()
+    admin = UserDirectory.query.filter_by(email='admin@example.com').first()
     if not admin:
+        admin_id = register_in_directory('admin', 'admin@example.com')
+        use_shard(admin_id)
         admin = User(
+            id=admin_id,
             username='admin',
             email='admin@example.com',
             password_hash=hash_password('admin123'),
@@ -37,6 +80,37 @@ with app.app_context():
         print('Password: admin123')
         print('='*50 + '\n')
 
+    # Pages have no dynamic content: render + compress them once, at startup
+    pages = PageCache(app, ['index.html', 'register.html', 'login.html',
+                            'dashboard.html', 'admin.html'])
+
+    resume_purges()  # Users disabled before the job queue existed
+    rank_unranked_todos()  # Todos from before manual ordering
+
+# Background threads don't survive a fork: a worker forked after this file
+# was imported (gunicorn --preload) starts its own on its first request,
+# the same way metrics.py restarts its flush thread.
+_background_pid = None
+_background_lock = threading.Lock()
+
+
+def start_background_threads():
+    """Job workers and schedulers, once per process."""
+    global _background_pid
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        _background_pid = os.getpid()
+    start_job_workers(app)            # Purges, backups, ... (see jobs.py)
+    start_reminder_scheduler(app)     # Due-date reminders (see reminders.py)
+    start_maintenance_scheduler(app)  # Nightly trash cleanup + VACUUM (a job)
+    start_backup_scheduler(app)       # Nightly online backups (see backup.py)
+
+
+on_reminder(lambda r: app.logger.info('Reminder for user %s: %s is due', r['user_id'], r['task_content']))
+start_background_threads()
+app.before_request(start_background_threads)
+
 
 # ============================================
 # PAGE ROUTES
@@ -44,23 +118,23 @@ with app.app_context():
 
 @app.route('/')
 def home():
-    return render_template('index.html')
+    return pages.serve('index.html')
 
 @app.route('/register')
 def register_page():
-    return render_template('register.html')
+    return pages.serve('register.html')
 
 @app.route('/login')
 def login_page():
-    return render_template('login.html')
+    return pages.serve('login.html')
 
 @app.route('/dashboard')
 def dashboard_page():
-    return render_template('dashboard.html')
+    return pages.serve('dashboard.html')
 
 @app.route('/admin')
 def admin_page():
-    return render_template('admin.html')
+    return pages.serve('admin.html')
 
 
 # ============================================
@@ -71,16 +145,26 @@ def admin_page():
 def register():
     data = request.get_json()
 
-    if User.query.filter_by(email=data['email']).first():
-        return jsonify({'error': 'Email already registered'}), 400
+    # Step 1: ONE cheap query for duplicates, before the expensive hashing
+    conflict = find_registration_conflict(data['username'], data['email'])
+    if conflict:
+        return jsonify({'error': conflict}), 400
 
-    if User.query.filter_by(username=data['username']).first():
-        return jsonify({'error': 'Username already taken'}), 400
+    password_hash = hash_password(data['password'])
+
+    # Step 2: The directory's unique indexes catch registrations that race us
+    try:
+        user_id = register_in_directory(data['username'], data['email'])
+    except IntegrityError as e:
+        db.session.rollback()
+        return jsonify({'error': registration_error_message(e)}), 400
+    use_shard(user_id)
 
     user = User(
+        id=user_id,
         username=data['username'],
         email=data['email'],
-        password_hash=hash_password(data['password'])  # is_admin defaults to False
+        password_hash=password_hash  # is_admin defaults to False
     )
 
     db.session.add(user)
@@ -93,16 +177,26 @@ def register():
 def login():
     data = request.get_json()
 
-    user = User.query.filter_by(email=data['email']).first()
+    # Find the user's id in the directory, then load them from their shard
+    user = None
+    # Emails are case-insensitive (uses ix_user_directory_email_lower)
+    entry = UserDirectory.query.filter(db.func.lower(UserDirectory.email) == data['email'].lower()).first()
+    if entry:
+        use_shard(entry.id)
+        user = User.query.get(entry.id)
 
-    if not user or not verify_password(data['password'], user.password_hash):
+    if not user or user.is_disabled or not verify_password(data['password'], user.password_hash):
         return jsonify({'error': 'Invalid email or password'}), 401
 
+    # Short-lived access token + refresh token (no password needed to renew)
     token = create_token(user.id)
+    refresh_token = issue_refresh_token(user.id)
 
     return jsonify({
         'message': 'Login successful',
         'token': token,
+        'refresh_token': refresh_token,
+        'expires_in': ACCESS_TOKEN_MINUTES * 60,
         'user': {
             'id': user.id,
             'username': user.username,
@@ -112,6 +206,31 @@ def login():
     })
 
 
+@app.route('/api/token/refresh', methods=['POST'])
+def refresh_token_route():
+    data = request.get_json(silent=True) or {}
+
+    # Swap the refresh token for a new one (each one works only once)
+    user_id, refresh_token, error = rotate_refresh_token(data.get('refresh_token'))
+    if error:
+        return error
+
+    return jsonify({
+        'token': create_token(user_id),
+        'refresh_token': refresh_token,
+        'expires_in': ACCESS_TOKEN_MINUTES * 60
+    })
+
+
+@app.route('/api/logout', methods=['POST'])
+def logout():
+    data = request.get_json(silent=True) or {}
+
+    # The access token simply expires; the refresh token stops working now
+    revoke_refresh_token(data.get('refresh_token'))
+    return jsonify({'message': 'Logged out'})
+
+
 # ============================================
 # TODO API (Protected - any logged in user)
 # ============================================
@@ -125,11 +244,112 @@ def get_todos():
     if error:
         return error
 
-    # Step 2: Get user's todos
-    todos = Todo.query.filter_by(user_id=current_user.id).all()
+    # Step 2: ?due_before=<ISO time> - open todos due by then, soonest first
+    if 'due_before' in request.args:
+        due_before, error = parse_due_at(request.args['due_before'])
+        if error:
+            return error
+        todos = Todo.query.filter(
+            Todo.user_id == current_user.id,
+            db.text(OPEN_DUE_TODOS_SQL),  # Same conditions as the partial index
+            Todo.due_at <= due_before
+        ).order_by(Todo.due_at).all()
+        return jsonify({'todos': [todo.to_dict() for todo in todos]})
+
+    # Step 3: ?tags=a,b&mode=all|any - todos with all/any of these tags
+    if 'tags' in request.args:
+        tag_filter, error = parse_tag_filter(request.args)
+        if error:
+            return error
+        query = Todo.query.filter_by(user_id=current_user.id, deleted_at=None)
+        todos = filter_by_tags(query, current_user.id, *tag_filter) \
+            .order_by(Todo.rank.is_(None), Todo.rank, Todo.id).all()
+        return jsonify({'todos': [todo.to_dict() for todo in todos]})
+
+    # Step 4: Get user's todos (not the ones in the trash) in the user's order,
+    # cached until they change
+    def build():
+        todos = Todo.query.filter_by(user_id=current_user.id, deleted_at=None) \
+            .order_by(Todo.rank.is_(None), Todo.rank, Todo.id).all()
+        return {'todos': [todo.to_dict() for todo in todos]}
+
+    return cached_todos_response(current_user.id, build)
+
+
+@app.route('/api/tags', methods=['GET'])
+def get_tags():
+    # Step 1: Check if user is logged in
+    current_user, error = get_current_user()
+    if error:
+        return error
+
+    # Step 2: The user's tags with how many live todos have each (no counting here)
+    return jsonify({'tags': [tag.to_dict() for tag in get_user_tags(current_user.id)]})
+
+
+@app.route('/api/todos/import', methods=['POST'])
+def import_todos_route():
+    # Step 1: Check if user is logged in
+    current_user, error = get_current_user()
+    if error:
+        return error
+
+    # Step 2: Stream the CSV/NDJSON upload into the database in batches
+    summary = import_todos(db, Todo, current_user.id, request.stream,
+                           request.content_type or '')
+    invalidate_todos(current_user.id)
+    if summary['accepted']:
+        schedule_rebalance(current_user.id)  # Gives the new todos ranks
+    return jsonify(summary), 201 if summary['accepted'] else 400
+
+
+@app.route('/api/todos/export', methods=['GET'])
+def export_todos():
+    # Step 1: Check if user is logged in
+    current_user, error = get_current_user()
+    if error:
+        return error
+
+    # Step 2: Stream the user's todos as a download (?format=csv|ndjson&after=<id>)
+    after = request.args.get('after', 0, type=int)
+    rows = user_todo_rows(db, Todo, ArchivedTodo, current_user.id, after)
+    return export_response(rows, TODO_FIELDS, request.args.get('format', 'csv'), 'todos')
+
+
+@app.route('/api/todos/trash', methods=['GET'])
+def get_trash():
+    # Step 1: Check if user is logged in
+    current_user, error = get_current_user()
+    if error:
+        return error
+
+    # Step 2: Get user's deleted todos (kept for a while, then purged)
+    todos = Todo.query.filter(
+        Todo.user_id == current_user.id,
+        Todo.deleted_at.isnot(None)
+    ).order_by(Todo.deleted_at.desc()).all()
     return jsonify({'todos': [todo.to_dict() for todo in todos]})
 
 
+@app.route('/api/todos/archive', methods=['GET'])
+def get_archive():
+    # Step 1: Check if user is logged in
+    current_user, error = get_current_user()
+    if error:
+        return error
+
+    # Step 2: Page through old completed todos, newest first (?before=<id>&limit=)
+    before = request.args.get('before', type=int)
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    query = ArchivedTodo.query.filter_by(user_id=current_user.id)
+    if before:
+        query = query.filter(ArchivedTodo.id < before)
+    todos = query.order_by(ArchivedTodo.id.desc()).limit(limit).all()
+
+    next_cursor = todos[-1].id if len(todos) == limit else None
+    return jsonify({'todos': [todo.to_dict() for todo in todos], 'next_before': next_cursor})
+
+
 @app.route('/api/todos', methods=['POST'])
 def create_todo():
     # Step 1: Check if user is logged in
@@ -137,15 +357,41 @@ def create_todo():
     if error:
         return error
 
-    # Step 2: Create todo
+    # Step 2: On a shared list? Then it is stored with the list owner's todos
     data = request.get_json()
+    list_id = data.get('list_id')
+    owner_id, error = use_list_shard(current_user, list_id, write=True)
+    if error:
+        return error
+    owner_id = owner_id or current_user.id
+
+    # Step 3: Create todo (due_at, tags and parent_id are optional)
+    due_at, error = parse_due_at(data.get('due_at'))
+    if error:
+        return error
+    tag_names, error = parse_tags(data.get('tags'))
+    if error:
+        return error
+    parent, error = find_parent(owner_id, data.get('parent_id'))
+    if error:
+        return error
+    if parent and parent.list_id != list_id:
+        return jsonify({'error': 'Parent todo is on another list'}), 400
     todo = Todo(
         task_content=data['task_content'],
-        user_id=current_user.id
+        due_at=due_at,
+        rank=rank_for_new_todo(owner_id),  # At the bottom
+        parent_id=parent.id if parent else None,
+        list_id=list_id,
+        user_id=owner_id
     )
 
     db.session.add(todo)
+    roll_up(todo.parent_id, 1, 0)  # "n of m done" of the parent and above
+    set_todo_tags(todo, tag_names)
     db.session.commit()
+    invalidate_todos(owner_id)
+    schedule_reminder(todo)
 
     return jsonify(todo.to_dict()), 201
 
@@ -157,21 +403,92 @@ def update_todo(todo_id):
     if error:
         return error
 
-    # Step 2: Find todo
-    todo = Todo.query.get_or_404(todo_id)
+    # Step 2: Find todo (todos in the trash can't be edited)
+    # (a todo on a shared list that lives on another shard needs ?list_id=)
+    _, error = use_list_shard(current_user, request.args.get('list_id', type=int))
+    if error:
+        return error
+    todo = Todo.query.filter_by(id=todo_id, deleted_at=None).first_or_404()
 
-    # Step 3: Check ownership
-    if todo.user_id != current_user.id:
-        return jsonify({'error': 'Not authorized'}), 403
+    # Step 3: Check access (the owner, or an editor of the todo's shared list)
+    error = check_todo_access(current_user, todo)
+    if error:
+        return error
 
     # Step 4: Update todo
     data = request.get_json()
     if 'task_content' in data:
         todo.task_content = data['task_content']
     if 'is_completed' in data:
+        if bool(data['is_completed']) != bool(todo.is_completed):
+            roll_up(todo.parent_id, 0, 1 if data['is_completed'] else -1)
         todo.is_completed = data['is_completed']
+        todo.completed_at = datetime.utcnow() if data['is_completed'] else None
+    if 'due_at' in data:
+        todo.due_at, error = parse_due_at(data['due_at'])
+        if error:
+            return error
+        todo.reminded_at = None  # New deadline, new reminder
+    if 'tags' in data:
+        tag_names, error = parse_tags(data['tags'])
+        if error:
+            return error
+        set_todo_tags(todo, tag_names)
 
     db.session.commit()
+    invalidate_todos(todo.user_id)
+    schedule_reminder(todo)
+    return jsonify(todo.to_dict())
+
+
+@app.route('/api/todos/<int:todo_id>/tree', methods=['GET'])
+def get_todo_tree(todo_id):
+    # Step 1: Check if user is logged in
+    current_user, error = get_current_user()
+    if error:
+        return error
+
+    # Step 2: Find todo
+    # (a todo on a shared list that lives on another shard needs ?list_id=)
+    _, error = use_list_shard(current_user, request.args.get('list_id', type=int))
+    if error:
+        return error
+    todo = Todo.query.filter_by(id=todo_id, deleted_at=None).first_or_404()
+
+    # Step 3: Check access (the owner, or a member of the todo's shared list)
+    error = check_todo_access(current_user, todo, write=False)
+    if error:
+        return error
+
+    # Step 4: The todo and all its subtasks, nested (one recursive query)
+    return jsonify(get_tree(todo))
+
+
+@app.route('/api/todos/<int:todo_id>/move', methods=['PATCH'])
+def move_todo_route(todo_id):
+    # Step 1: Check if user is logged in
+    current_user, error = get_current_user()
+    if error:
+        return error
+
+    # Step 2: Find todo
+    # (a todo on a shared list that lives on another shard needs ?list_id=)
+    _, error = use_list_shard(current_user, request.args.get('list_id', type=int))
+    if error:
+        return error
+    todo = Todo.query.filter_by(id=todo_id, deleted_at=None).first_or_404()
+
+    # Step 3: Check access (the owner, or an editor of the todo's shared list)
+    error = check_todo_access(current_user, todo)
+    if error:
+        return error
+
+    # Step 4: Give it a rank between its new neighbours (one row changes)
+    todo, error = move_todo(todo, request.get_json() or {})
+    if error:
+        return error
+    invalidate_todos(todo.user_id)
+
     return jsonify(todo.to_dict())
 
 
@@ -183,19 +500,169 @@ def delete_todo(todo_id):
         return error
 
     # Step 2: Find todo
-    todo = Todo.query.get_or_404(todo_id)
+    # (a todo on a shared list that lives on another shard needs ?list_id=)
+    _, error = use_list_shard(current_user, request.args.get('list_id', type=int))
+    if error:
+        return error
+    todo = Todo.query.filter_by(id=todo_id, deleted_at=None).first_or_404()
 
-    # Step 3: Check ownership
-    if todo.user_id != current_user.id:
-        return jsonify({'error': 'Not authorized'}), 403
+    # Step 3: Check access (the owner, or an editor of the todo's shared list)
+    error = check_todo_access(current_user, todo)
+    if error:
+        return error
 
-    # Step 4: Delete todo
-    db.session.delete(todo)
-    db.session.commit()
+    # Step 4: Move todo and its subtasks to the trash (soft delete)
+    trash_subtree(todo)
+    invalidate_todos(todo.user_id)
 
     return jsonify({'message': 'Todo deleted'})
 
 
+@app.route('/api/todos/<int:todo_id>/restore', methods=['POST'])
+def restore_todo(todo_id):
+    # Step 1: Check if user is logged in
+    current_user, error = get_current_user()
+    if error:
+        return error
+
+    # Step 2: Find todo in the trash
+    # (a todo on a shared list that lives on another shard needs ?list_id=)
+    _, error = use_list_shard(current_user, request.args.get('list_id', type=int))
+    if error:
+        return error
+    todo = Todo.query.filter(Todo.id == todo_id, Todo.deleted_at.isnot(None)).first_or_404()
+
+    # Step 3: Check access (the owner, or an editor of the todo's shared list)
+    error = check_todo_access(current_user, todo)
+    if error:
+        return error
+
+    # Step 4: Take it (and the subtasks trashed with it) out of the trash
+    error = restore_subtree(todo)
+    if error:
+        return error
+    invalidate_todos(todo.user_id)
+
+    return jsonify(todo.to_dict())
+
+
+# ============================================
+# SHARED LISTS API (see sharing.py)
+# ============================================
+
+@app.route('/api/lists', methods=['GET'])
+def get_lists():
+    # Step 1: Check if user is logged in
+    current_user, error = get_current_user()
+    if error:
+        return error
+
+    # Step 2: Every list the user is on, with their role (one query)
+    return jsonify({'lists': get_user_lists(current_user)})
+
+
+@app.route('/api/lists', methods=['POST'])
+def create_list_route():
+    # Step 1: Check if user is logged in
+    current_user, error = get_current_user()
+    if error:
+        return error
+
+    # Step 2: Create the list, with the user as its owner
+    todo_list, error = create_list(current_user, (request.get_json() or {}).get('name'))
+    if error:
+        return error
+    return jsonify(todo_list.to_dict()), 201
+
+
+@app.route('/api/lists/todos', methods=['GET'])
+def get_shared_todos():
+    # Step 1: Check if user is logged in
+    current_user, error = get_current_user()
+    if error:
+        return error
+
+    # Step 2: Todos of all the user's lists; can_edit comes from the same membership query
+    return jsonify({'todos': shared_todos(current_user)})
+
+
+@app.route('/api/lists/<int:list_id>/todos', methods=['GET'])
+def get_list_todos(list_id):
+    # Step 1: Check if user is logged in
+    current_user, error = get_current_user()
+    if error:
+        return error
+
+    # Step 2: Check the user is on the list (and go to the owner's shard)
+    _, error = use_list_shard(current_user, list_id)
+    if error:
+        return error
+
+    # Step 3: The list's todos, in order
+    return jsonify({'todos': [todo.to_dict() for todo in list_todos(list_id)]})
+
+
+@app.route('/api/lists/<int:list_id>/members', methods=['GET'])
+def get_list_members(list_id):
+    # Step 1: Check if user is logged in
+    current_user, error = get_current_user()
+    if error:
+        return error
+
+    # Step 2: Any member may see who else is on the list
+    if list_role(current_user, list_id) is None:
+        return jsonify({'error': 'List not found'}), 404
+    return jsonify({'members': get_members(list_id)})
+
+
+@app.route('/api/lists/<int:list_id>/members', methods=['POST'])
+def add_list_member(list_id):
+    # Step 1: Check if user is logged in
+    current_user, error = get_current_user()
+    if error:
+        return error
+
+    # Step 2: Only the owner manages members
+    if list_role(current_user, list_id) != 'owner':
+        return jsonify({'error': 'Not authorized'}), 403
+
+    # Step 3: Add the user (or change their role)
+    data = request.get_json() or {}
+    member, error = add_member(list_id, data.get('email'), data.get('role', 'editor'))
+    if error:
+        return error
+    return jsonify(member), 201
+
+
+@app.route('/api/lists/<int:list_id>/members/<int:user_id>', methods=['DELETE'])
+def remove_list_member(list_id, user_id):
+    # Step 1: Check if user is logged in
+    current_user, error = get_current_user()
+    if error:
+        return error
+
+    # Step 2: The owner removes anyone; members can leave
+    if list_role(current_user, list_id) != 'owner' and user_id != current_user.id:
+        return jsonify({'error': 'Not authorized'}), 403
+
+    error = remove_member(list_id, user_id)
+    if error:
+        return error
+    return jsonify({'message': 'Member removed'})
+
+
+@app.route('/api/batch', methods=['POST'])
+def batch_requests():
+    # Step 1: Check if user is logged in (once for the whole batch)
+    current_user, error = get_current_user()
+    if error:
+        return error
+
+    # Step 2: Run each sub-request through its normal route (see batch.py)
+    db.session.expunge(current_user)  # Each sub-request attaches it to its own session
+    return batch_response(app, current_user)
+
+
 # ============================================
 # ADMIN API (Only users with is_admin=True)
 # ============================================
@@ -208,9 +675,13 @@ def get_all_users():
     if error:
         return error  # Returns 401 if not logged in, 403 if not admin
 
-    # Step 2: Get all users
-    users = User.query.all()
-    return jsonify({'users': [user.to_dict_with_stats() for user in users]})
+    # Step 2: Read the paging, search and sort options
+    options, error = parse_user_query(request.args)
+    if error:
+        return error
+
+    # Step 3: Get one page from every shard (in parallel) and merge them
+    return jsonify(search_users(options))
 
 
 @app.route('/api/admin/users/<int:user_id>', methods=['DELETE'])
@@ -224,13 +695,50 @@ def delete_user(user_id):
     if user_id == current_user.id:
         return jsonify({'error': 'Cannot delete yourself'}), 400
 
-    # Step 3: Find and delete user
+    # Step 3: Disable the user now (locks them out), purge their data later
+    use_shard(user_id)
     user = User.query.get_or_404(user_id)
-    Todo.query.filter_by(user_id=user_id).delete()  # Delete user's todos first
-    db.session.delete(user)
+    user.is_disabled = True
     db.session.commit()
+    invalidate_todos(user.id)  # Drop their cached list everywhere
+    revoke_user_tokens(user.id)  # No more new access tokens for them
 
-    return jsonify({'message': f'User {user.username} deleted'})
+    # Step 4: A background thread deletes their todos in small batches
+    schedule_purge(user.id, user.username)
+
+    return jsonify({'message': f'User {user.username} deleted'}), 202
+
+
+@app.route('/api/admin/purges', methods=['GET'])
+def get_purges():
+    # Step 1: Check if user is admin
+    current_user, error = get_admin_user()
+    if error:
+        return error
+
+    # Step 2: Show progress of background user deletions
+    return jsonify({'purges': get_purge_status()})
+
+
+@app.route('/api/admin/export', methods=['GET'])
+def admin_export():
+    # Step 1: Check if user is admin
+    current_user, error = get_admin_user()
+    if error:
+        return error
+
+    # Step 2: Stream all users (with stats) or all todos from every shard
+    # (?type=users|todos&format=csv|ndjson&after=<shard>:<id>)
+    after = request.args.get('after')
+    try:
+        parse_admin_cursor(after)
+    except ValueError:
+        return jsonify({'error': 'after must look like <shard>:<id>'}), 400
+
+    fmt = request.args.get('format', 'csv')
+    if request.args.get('type', 'users') == 'todos':
+        return export_response(all_todo_rows(db, User, Todo, after), ADMIN_TODO_FIELDS, fmt, 'all-todos')
+    return export_response(all_user_rows(db, User, Todo, after), USER_FIELDS, fmt, 'all-users')
 
 
 @app.route('/api/admin/stats', methods=['GET'])
@@ -240,10 +748,19 @@ def get_stats():
     if error:
         return error
 
-    # Step 2: Calculate stats
-    total_users = User.query.count()
-    total_todos = Todo.query.count()
-    completed_todos = Todo.query.filter_by(is_completed=True).count()
+    # Step 2: Calculate stats on every shard (in parallel) and add them up
+    def count_rows():
+        archived = ArchivedTodo.query.count()  # Archived todos are all completed
+        return (
+            User.query.count(),
+            Todo.query.filter_by(deleted_at=None).count() + archived,
+            Todo.query.filter_by(deleted_at=None, is_completed=True).count() + archived
+        )
+
+    counts = fan_out(count_rows)
+    total_users = sum(c[0] for c in counts)
+    total_todos = sum(c[1] for c in counts)
+    completed_todos = sum(c[2] for c in counts)
 
     return jsonify({
         'total_users': total_users,
@@ -260,15 +777,110 @@ def get_all_todos():
     if error:
         return error
 
-    # Step 2: Get ALL todos (not just admin's)
-    todos = Todo.query.all()
-    result = []
-    for todo in todos:
-        todo_data = todo.to_dict()
-        todo_data['username'] = todo.user.username  # Add owner's username
-        result.append(todo_data)
+    # Step 2: Get ALL todos (not just admin's) from every shard
+    def list_todos():
+        result = []
+        for todo in Todo.query.filter_by(deleted_at=None).all():
+            todo_data = todo.to_dict()
+            todo_data['username'] = todo.user.username  # Add owner's username
+            result.append(todo_data)
+        return result
+
+    result = [todo for shard_todos in fan_out(list_todos) for todo in shard_todos]
+    result.sort(key=lambda todo: todo['created_at'])
     return jsonify({'todos': result})
 
 
+
+@app.route('/api/admin/maintenance', methods=['GET'])
+def get_maintenance():
+    # Step 1: Check if user is admin
+    current_user, error = get_admin_user()
+    if error:
+        return error
+
+    # Step 2: Show the result of the last maintenance run
+    return jsonify(get_maintenance_status())
+
+
+@app.route('/api/admin/maintenance', methods=['POST'])
+def create_maintenance_run():
+    # Step 1: Check if user is admin
+    current_user, error = get_admin_user()
+    if error:
+        return error
+
+    # Step 2: Queue maintenance now instead of waiting for the night
+    job_id = start_maintenance()
+    if job_id is None:
+        return jsonify({'message': 'Maintenance is already queued or running'}), 202
+    return jsonify({'message': 'Maintenance started', 'job_id': job_id}), 202
+
+
+
+@app.route('/api/admin/slow-queries', methods=['GET'])
+def get_slow_queries():
+    # Step 1: Check if user is admin
+    current_user, error = get_admin_user()
+    if error:
+        return error
+
+    # Step 2: The slowest SQL statements seen by this process (see slow_queries.py)
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify({'queries': slow_query_report(limit)})
+
+
+
+@app.route('/api/admin/backups', methods=['GET'])
+def get_backups():
+    # Step 1: Check if user is admin
+    current_user, error = get_admin_user()
+    if error:
+        return error
+
+    # Step 2: List snapshots and the report of the last backup run
+    return jsonify(get_backup_status())
+
+
+@app.route('/api/admin/backups', methods=['POST'])
+def create_backup():
+    # Step 1: Check if user is admin
+    current_user, error = get_admin_user()
+    if error:
+        return error
+
+    # Step 2: Queue a backup of every database (app keeps running)
+    job_id = start_backup()
+    if job_id is None:
+        return jsonify({'message': 'A backup is already queued or running'}), 202
+    return jsonify({'message': 'Backup started', 'job_id': job_id}), 202
+
+
+@app.route('/api/admin/jobs', methods=['GET'])
+def get_jobs():
+    # Step 1: Check if user is admin
+    current_user, error = get_admin_user()
+    if error:
+        return error
+
+    # Step 2: Queue overview + newest jobs (?kind=purge_user&status=failed&limit=50)
+    jobs = list_jobs(kind=request.args.get('kind'), status=request.args.get('status'),
+                     limit=min(request.args.get('limit', 50, type=int), 200))
+    return jsonify({'queues': get_queue_status(), 'jobs': jobs})
+
+
+@app.route('/api/admin/jobs/<int:job_id>/retry', methods=['POST'])
+def retry_failed_job(job_id):
+    # Step 1: Check if user is admin
+    current_user, error = get_admin_user()
+    if error:
+        return error
+
+    # Step 2: Put a failed job back in the queue
+    if not retry_job(job_id):
+        return jsonify({'error': 'Only failed jobs can be retried'}), 400
+    return jsonify({'message': 'Job queued again'})
+
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,59 @@
+# =============================================================================
+# Part 7: Archiving Old Completed Todos
+# =============================================================================
+# Completed todos pile up forever, and every GET /api/todos has to read past
+# them. Todos completed more than ARCHIVE_AFTER_DAYS days ago are moved into
+# the todos_archive table (same database file, so a user's data still lives
+# on one shard). The todos table stays small and fast.
+#
+# Archiving runs as part of the nightly maintenance job (maintenance.py),
+# BATCH_SIZE todos per short transaction.
+# Users can still page through their archive at GET /api/todos/archive, and
+# their export (GET /api/todos/export) includes it.
+#
+# Deleting the todo row also deletes its todo_tags links (a trigger in
+# tags.py), so the tag NAMES are copied into todos_archive.tags first.
+
+import os
+from datetime import datetime, timedelta
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '90'))
+BATCH_SIZE = 500
+
+
+def archive_completed_todos(engine):
+    """Moves old completed todos to todos_archive. Returns how many moved."""
+    now = datetime.utcnow()
+    cutoff = (now - timedelta(days=ARCHIVE_AFTER_DAYS)).isoformat(sep=' ')
+    moved = 0
+
+    while True:
+        with engine.begin() as conn:  # Copy + delete in ONE short transaction
+            ids = [row[0] for row in conn.exec_driver_sql(
+                'SELECT id FROM todos '
+                'WHERE is_completed = 1 AND deleted_at IS NULL '
+                # Subtasks and todos with subtasks stay together (see subtasks.py)
+                '  AND parent_id IS NULL AND subtask_total = 0 '
+                # Todos completed before completed_at existed: use created_at
+                '  AND COALESCE(completed_at, created_at) < ? '
+                'LIMIT ?',
+                (cutoff, BATCH_SIZE)
+            )]
+            if not ids:
+                return moved
+
+            placeholders = ', '.join('?' * len(ids))
+            conn.exec_driver_sql(
+                'INSERT INTO todos_archive '
+                '  (todo_id, task_content, created_at, completed_at, archived_at, user_id, tags) '
+                'SELECT id, task_content, created_at, COALESCE(completed_at, created_at), ?, user_id, '
+                '  (SELECT group_concat(tags.name, \',\') FROM todo_tags '
+                '   JOIN tags ON tags.id = todo_tags.tag_id WHERE todo_tags.todo_id = todos.id) '
+                f'FROM todos WHERE id IN ({placeholders})',
+                (now.isoformat(sep=' '), *ids)
+            )
+            conn.exec_driver_sql(f'DELETE FROM todos WHERE id IN ({placeholders})', tuple(ids))
+
+        moved += len(ids)
+        if len(ids) < BATCH_SIZE:
+            return moved
@@ -6,9 +6,12 @@ import jwt
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 # Note: We don't need 'wraps' anymore since we're not using decorators
-from flask import request, jsonify
+from flask import request, jsonify, g
+from sharding import use_shard
+from metrics import track_kdf
 
 SECRET_KEY = 'your-secret-key-change-in-production'
+ACCESS_TOKEN_MINUTES = 15  # Short-lived; renewed with a refresh token (see refresh_tokens.py)
 
 
 # =============================================================================
@@ -16,10 +19,12 @@ SECRET_KEY = 'your-secret-key-change-in-production'
 # =============================================================================
 
 def hash_password(password):
-    return generate_password_hash(password)
+    with track_kdf():  # Hashing is slow on purpose - count it in /metrics
+        return generate_password_hash(password)
 
 def verify_password(password, password_hash):
-    return check_password_hash(password_hash, password)
+    with track_kdf():
+        return check_password_hash(password_hash, password)
 
 
 # =============================================================================
@@ -29,7 +34,7 @@ def verify_password(password, password_hash):
 def create_token(user_id):
     payload = {
         'user_id': user_id,
-        'exp': datetime.utcnow() + timedelta(hours=24)
+        'exp': datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_MINUTES)
     }
     return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
 
@@ -53,7 +58,14 @@ def get_current_user():
     Validates JWT token and returns current user.
     Returns: (user, None) on success, (None, error_response) on failure
     """
-    from models import User
+    from models import db, User
+
+    # Inside POST /api/batch the token was already checked once (see batch.py):
+    # attach that user to this sub-request's session without another query
+    batch_user = g.get('batch_user')
+    if batch_user is not None:
+        use_shard(batch_user.id)
+        return db.session.merge(batch_user, load=False), None
 
     # Step 1: Check if Authorization header exists
     if 'Authorization' not in request.headers:
@@ -71,11 +83,16 @@ def get_current_user():
     if not user_id:
         return None, (jsonify({'error': 'Token is invalid or expired'}), 401)
 
-    # Step 4: Get user from database
+    # Step 4: Get user from database (on the user's shard)
+    use_shard(user_id)
     current_user = User.query.get(user_id)
     if not current_user:
         return None, (jsonify({'error': 'User not found'}), 401)
 
+    # Step 5: Users being deleted are locked out immediately
+    if current_user.is_disabled:
+        return None, (jsonify({'error': 'Account disabled'}), 401)
+
     return current_user, None
 
 
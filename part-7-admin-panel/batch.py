@@ -0,0 +1,98 @@
+# =============================================================================
+# Part 7: Batch Requests (several API calls in one HTTP request)
+# =============================================================================
+# The admin page needs stats, users and todos: three requests, three round
+# trips, and three times the token is decoded and the user looked up.
+# POST /api/batch does it in one:
+#
+#   {"requests": [{"method": "GET", "path": "/api/admin/stats"},
+#                 {"method": "PUT", "path": "/api/todos/3", "body": {"is_completed": true}}]}
+#
+#   -> {"responses": [{"status": 200, "body": {...}}, {"status": 200, "body": {...}}]}
+#
+# The token is checked ONCE. Each sub-request then goes through the normal
+# Flask URL map and route function (and the rate limiter), so a sub-request
+# can do exactly what the same request on its own could do.
+#
+# Reads next to each other (GET) run at the same time on a thread pool.
+# Writes run one at a time, in order, so "delete, then reload" works.
+
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import request, jsonify, g
+
+MAX_SUB_REQUESTS = 20
+WORKERS = 4
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+_pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='batch')
+
+
+def _validate(sub_requests):
+    """Returns an error message, or None if the batch looks fine."""
+    if not isinstance(sub_requests, list) or not sub_requests:
+        return 'requests must be a non-empty list'
+    if len(sub_requests) > MAX_SUB_REQUESTS:
+        return f'At most {MAX_SUB_REQUESTS} requests per batch'
+    for sub in sub_requests:
+        if not isinstance(sub, dict) or not str(sub.get('path', '')).startswith('/api/'):
+            return 'Each request needs a path starting with /api/'
+        if sub.get('method', 'GET').upper() not in METHODS:
+            return f"Unsupported method: {sub.get('method')}"
+        if sub['path'].split('?')[0] == '/api/batch':
+            return 'Batches cannot be nested'
+    return None
+
+
+def _response_body(response):
+    if response.is_json:
+        return response.get_json()
+    return response.get_data(as_text=True)
+
+
+def _run_one(app, user, sub, environ):
+    """Runs one sub-request in its own app + request context (own DB session)."""
+    with app.app_context():
+        g.batch_user = user  # get_current_user() uses this instead of the token
+        with app.test_request_context(sub['path'], method=sub.get('method', 'GET').upper(),
+                                      json=sub.get('body'), **environ):
+            try:
+                response = app.full_dispatch_request()
+            except Exception:
+                app.logger.exception('Batch sub-request failed: %s', sub['path'])
+                return {'status': 500, 'body': {'error': 'Internal server error'}}
+            return {'status': response.status_code, 'body': _response_body(response)}
+
+
+def run_batch(app, user, sub_requests):
+    """Runs the sub-requests: runs of GETs in parallel, writes in order."""
+    environ = {
+        # Passed on so rate limits and logs still see the real client
+        'headers': {'Authorization': request.headers.get('Authorization', '')},
+        'environ_base': {'REMOTE_ADDR': request.remote_addr},
+    }
+    results, reads = [], []
+
+    def finish_reads():
+        results.extend(future.result() for future in reads)
+        reads.clear()
+
+    for sub in sub_requests:
+        if sub.get('method', 'GET').upper() == 'GET':
+            reads.append(_pool.submit(_run_one, app, user, sub, environ))
+        else:
+            finish_reads()  # A write waits for the reads before it...
+            results.append(_pool.submit(_run_one, app, user, sub, environ).result())
+    finish_reads()          # ...and the reads after it wait for the write
+
+    return results
+
+
+def batch_response(app, user):
+    """Body of POST /api/batch (the caller has already checked the token)."""
+    sub_requests = (request.get_json(silent=True) or {}).get('requests')
+    problem = _validate(sub_requests)
+    if problem:
+        return jsonify({'error': problem}), 400
+
+    return jsonify({'responses': run_batch(app, user, sub_requests)})
@@ -0,0 +1,126 @@
+# =============================================================================
+# Part 7: Response Compression
+# =============================================================================
+# Two ideas here:
+#
+#   1. API responses (JSON) bigger than MIN_SIZE are compressed on the fly,
+#      using the best encoding the browser accepts (br, zstd or gzip).
+#   2. The HTML pages never change while the app runs, so we compress them
+#      ONCE and serve the bytes straight from memory, with an ETag so the
+#      browser can skip the download entirely (304 Not Modified).
+#      See page_cache.py for how the pages are rendered and kept.
+#
+# brotli and zstandard are optional: `pip install brotli zstandard`.
+# Without them we fall back to gzip, which is always available.
+
+import gzip
+import hashlib
+
+from flask import request, make_response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MIN_SIZE = 1024  # Bytes. Smaller responses are not worth compressing.
+
+
+# =============================================================================
+# ENCODERS
+# =============================================================================
+
+def _available_encoders():
+    """Returns {encoding: compress_function}, best encoding first."""
+    encoders = {}
+    if brotli:
+        encoders['br'] = lambda data: brotli.compress(data, quality=5)
+    if zstandard:
+        encoders['zstd'] = lambda data: zstandard.ZstdCompressor(level=3).compress(data)
+    encoders['gzip'] = lambda data: gzip.compress(data, compresslevel=6)
+    return encoders
+
+
+ENCODERS = _available_encoders()
+
+
+def choose_encoding(accept_encoding):
+    """
+    Picks the best encoding from an Accept-Encoding header.
+    Example: "gzip, deflate, br" -> "br" (if brotli is installed)
+    Returns None if the client accepts none of ours.
+    """
+    accepted = set()
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0'):
+            continue  # q=0 means "never send me this"
+        accepted.add(name.strip().lower())
+
+    for encoding in ENCODERS:
+        if encoding in accepted or '*' in accepted:
+            return encoding
+    return None
+
+
+# =============================================================================
+# 1. API RESPONSES (after_request hook)
+# =============================================================================
+
+def compress_response(response):
+    """Compresses large JSON responses. Register with app.after_request."""
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype != 'application/json'):
+        return response
+
+    data = response.get_data()
+    if len(data) < MIN_SIZE:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding is None:
+        return response
+
+    response.set_data(ENCODERS[encoding](data))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+# =============================================================================
+# 2. PRECOMPRESSED PAGES
+# =============================================================================
+
+class StaticPage:
+    """A rendered template, kept in memory in every available encoding."""
+
+    def __init__(self, html):
+        self.bodies = {None: html}
+        for encoding, compress in ENCODERS.items():
+            self.bodies[encoding] = compress(html)
+        self.etag = hashlib.sha256(html).hexdigest()[:32]
+
+
+def serve_static_page(page):
+    """Sends a StaticPage, compressed if possible, with a strong ETag."""
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+
+    response = make_response(page.bodies[encoding])
+    response.mimetype = 'text/html'
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+        # Each encoding is a different set of bytes, so it gets its own ETag
+        response.set_etag(f'{page.etag}-{encoding}')
+    else:
+        response.set_etag(page.etag)
+
+    return response.make_conditional(request)  # 304 if the ETag matches
@@ -0,0 +1,153 @@
+# =============================================================================
+# Part 7: Streaming Export (CSV or NDJSON)
+# =============================================================================
+# Exporting 1,000,000 todos with jsonify() would build one giant list in
+# memory. Instead the export is a GENERATOR: it reads CHUNK_SIZE rows,
+# sends them to the browser, forgets them, and reads the next chunk.
+# Memory use stays the same no matter how many rows there are.
+#
+# Rows are read with "keyset pagination": WHERE id > last_id ORDER BY id.
+# That also makes an interrupted download resumable - pass the last id you
+# received as ?after=<id> and the export continues from there.
+#
+# A user's export includes their archived todos (archive.py): both tables are
+# read in todo id order and merged, so ?after=<id> works across both.
+#
+#   GET /api/todos/export?format=csv            your todos
+#   GET /api/admin/export?type=users&format=ndjson   all users + stats
+#   GET /api/admin/export?type=todos            all todos + owner
+
+import csv
+import heapq
+import io
+import json
+
+from flask import Response, stream_with_context, g
+from sqlalchemy import select, literal
+
+from sharding import SHARD_COUNT, shard_key
+
+CHUNK_SIZE = 1000
+
+TODO_FIELDS = ['id', 'task_content', 'is_completed', 'created_at', 'user_id', 'archived']
+USER_FIELDS = ['shard', 'id', 'username', 'email', 'is_admin', 'created_at',
+               'total_todos', 'completed_todos']
+ADMIN_TODO_FIELDS = ['shard', 'id', 'username', 'task_content', 'is_completed',
+                     'created_at', 'user_id']
+
+
+# =============================================================================
+# FORMATTING
+# =============================================================================
+
+def _to_text(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def _csv_lines(fields, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow([_to_text(row[f]) for f in fields])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.getvalue():  # Only the header (no rows at all)
+        yield buffer.getvalue()
+
+
+def _ndjson_lines(fields, rows):
+    for row in rows:
+        yield json.dumps({f: _to_text(row[f]) for f in fields}) + '\n'
+
+
+def export_response(rows, fields, fmt, filename):
+    """Streams rows (an iterator of dicts) as a CSV or NDJSON download."""
+    if fmt == 'ndjson':
+        body, mimetype, extension = _ndjson_lines(fields, rows), 'application/x-ndjson', 'ndjson'
+    else:
+        body, mimetype, extension = _csv_lines(fields, rows), 'text/csv', 'csv'
+
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}.{extension}'
+    return response
+
+
+# =============================================================================
+# READING ROWS IN CHUNKS
+# =============================================================================
+
+def _keyset_chunks(db, build_query, id_column, after):
+    """Runs build_query() WHERE id > after, CHUNK_SIZE rows at a time."""
+    while True:
+        query = build_query().where(id_column > after).order_by(id_column).limit(CHUNK_SIZE)
+        rows = db.session.execute(query).mappings().all()
+        db.session.rollback()  # End the read transaction between chunks
+        yield from rows
+        if len(rows) < CHUNK_SIZE:
+            return
+        after = rows[-1]['id']
+
+
+def user_todo_rows(db, Todo, ArchivedTodo, user_id, after=0):
+    """
+    One user's todos, live and archived, in id order (their shard is
+    already selected by get_current_user).
+    """
+    def live_query():
+        return select(Todo.id, Todo.task_content, Todo.is_completed, Todo.created_at,
+                      Todo.user_id, literal(False).label('archived')).where(
+            Todo.user_id == user_id, Todo.deleted_at.is_(None))
+
+    def archived_query():
+        return select(ArchivedTodo.todo_id.label('id'), ArchivedTodo.task_content,
+                      literal(True).label('is_completed'), ArchivedTodo.created_at,
+                      ArchivedTodo.user_id, literal(True).label('archived')).where(
+            ArchivedTodo.user_id == user_id)
+
+    return heapq.merge(_keyset_chunks(db, live_query, Todo.id, after),
+                       _keyset_chunks(db, archived_query, ArchivedTodo.todo_id, after),
+                       key=lambda row: row['id'])
+
+
+def parse_admin_cursor(after):
+    """Admin cursors are 'shard:id' (todo ids repeat across shards)."""
+    if not after:
+        return 0, 0
+    shard, _, last_id = after.partition(':')
+    return int(shard), int(last_id or 0)
+
+
+def _all_shards(db, build_query, id_column, after):
+    start_shard, last_id = parse_admin_cursor(after)
+    for number in range(start_shard, SHARD_COUNT):
+        g.shard = shard_key(number)
+        for row in _keyset_chunks(db, build_query, id_column, last_id if number == start_shard else 0):
+            yield dict(row, shard=number)
+
+
+def all_user_rows(db, User, Todo, after=None):
+    """
+    Every user with todo counts, shard by shard. The counts are the
+    trigger-maintained counters (archived todos included), the same numbers
+    /api/admin/users and /api/admin/stats show - and no GROUP BY over todos.
+    """
+    def build_query():
+        return select(User.id, User.username, User.email, User.is_admin, User.created_at,
+                      User.total_todos, User.completed_todos)
+
+    return _all_shards(db, build_query, User.id, after)
+
+
+def all_todo_rows(db, User, Todo, after=None):
+    """Every todo with its owner's username, shard by shard."""
+    def build_query():
+        return (
+            select(Todo.id, User.username, Todo.task_content, Todo.is_completed,
+                   Todo.created_at, Todo.user_id)
+            .join(User, User.id == Todo.user_id)
+            .where(Todo.deleted_at.is_(None))
+        )
+
+    return _all_shards(db, build_query, Todo.id, after)
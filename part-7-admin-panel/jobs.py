@@ -0,0 +1,277 @@
+# =============================================================================
+# Part 7: Background Job Queue (SQLite, no broker needed)
+# =============================================================================
+# Some work is too slow for a request: purging a user with 100,000 todos,
+# backing up every database... Before, each feature started its own thread
+# and kept its queue in memory, so a restart forgot everything.
+#
+# Now jobs are rows in a small local SQLite file (instance/jobs.db):
+#
+#   enqueue('purge_user', {'user_id': 5}, priority=10)
+#
+# WORKERS threads in every app process take the next job:
+#   - highest priority first, then oldest
+#   - at most `concurrency` jobs of one kind run at once (across processes)
+#   - a failed job is retried after 2, 4, 8, ... seconds, up to max_attempts
+#   - a running job holds a LEASE; if its process dies, the lease runs out
+#     and another worker picks the job up again
+#   - if the queue itself fails (jobs.db locked, ...), the worker logs it,
+#     waits ERROR_PAUSE_SECONDS and carries on
+#
+# Admins can watch the queue at GET /api/admin/jobs.
+
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from local_store import LocalStore
+
+WORKERS = int(os.environ.get('JOB_WORKERS', '2'))  # Worker threads per process
+LEASE_SECONDS = 300      # A running job nobody reports on for this long is retried
+POLL_SECONDS = 1.0       # How often idle workers look for new jobs
+ERROR_PAUSE_SECONDS = 5  # Pause after the queue itself failed (e.g. jobs.db locked)
+BACKOFF_SECONDS = 2      # First retry delay (doubles every attempt)
+MAX_BACKOFF_SECONDS = 600
+KEEP_FINISHED_DAYS = 7   # Finished jobs are deleted by the maintenance job
+
+_handlers = {}           # kind -> {'func', 'concurrency', 'max_attempts'}
+_store = LocalStore('jobs.db', timeout=5, row_factory=sqlite3.Row)
+_wake_up = threading.Event()
+_started_pid = None
+
+
+# =============================================================================
+# SETUP
+# =============================================================================
+
+def register_job(kind, func, concurrency=1, max_attempts=5):
+    """
+    Tells the queue how to run jobs of one kind.
+    func(payload, report) - call report(key=value) to save progress.
+    """
+    _handlers[kind] = {'func': func, 'concurrency': concurrency, 'max_attempts': max_attempts}
+
+
+def init_jobs(app):
+    """Creates the queue table (jobs can be queued from now on)."""
+    _store.open(app, """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            dedupe_key TEXT,
+            priority INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            run_at REAL NOT NULL,
+            lease_until REAL,
+            progress TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            finished_at REAL
+        );
+        -- "Next job" = the first row of this index that is ready to run
+        CREATE INDEX IF NOT EXISTS ix_jobs_next ON jobs (status, priority DESC, run_at, id);
+        -- The same job (e.g. purge user 5) can't be queued twice
+        CREATE UNIQUE INDEX IF NOT EXISTS ix_jobs_dedupe ON jobs (dedupe_key)
+            WHERE dedupe_key IS NOT NULL AND status IN ('queued', 'running');
+    """)
+
+
+def start_job_workers(app):
+    """Starts WORKERS threads that run queued jobs (once per process)."""
+    global _started_pid
+    if _started_pid != os.getpid():  # Forked workers call this again (see app.py)
+        _started_pid = os.getpid()
+        for number in range(WORKERS):
+            threading.Thread(target=_work, args=(app,), name=f'job-worker-{number}', daemon=True).start()
+
+
+# =============================================================================
+# ADDING JOBS
+# =============================================================================
+
+def enqueue(kind, payload, priority=0, delay=0, dedupe_key=None):
+    """
+    Adds a job. Returns its id, or None if a job with the same dedupe_key
+    is already queued or running.
+    """
+    now = time.time()
+    cursor = _store.connection().execute(
+        'INSERT OR IGNORE INTO jobs (kind, payload, dedupe_key, priority, max_attempts, run_at, created_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (kind, json.dumps(payload), dedupe_key, priority,
+         _handlers[kind]['max_attempts'], now + delay, now)
+    )
+    _wake_up.set()  # Don't make a worker in this process wait for its next poll
+    return cursor.lastrowid if cursor.rowcount else None
+
+
+def retry_job(job_id):
+    """Puts a failed job back in the queue (admin action). Returns True if it was failed."""
+    try:
+        cursor = _store.connection().execute(
+            "UPDATE jobs SET status = 'queued', attempts = 0, run_at = ?, error = NULL "
+            "WHERE id = ? AND status = 'failed'",
+            (time.time(), job_id)
+        )
+    except sqlite3.IntegrityError:
+        return False  # The same job was queued again in the meantime
+    _wake_up.set()
+    return cursor.rowcount == 1
+
+
+# =============================================================================
+# RUNNING JOBS
+# =============================================================================
+
+def _claim_next_job():
+    """Takes the next job that may run now, or returns None."""
+    conn = _store.connection()
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')  # One claimer at a time (also across processes)
+    try:
+        running = dict(conn.execute(
+            "SELECT kind, COUNT(*) FROM jobs WHERE status = 'running' AND lease_until >= ? GROUP BY kind",
+            (now,)
+        ).fetchall())
+        full = [kind for kind, handler in _handlers.items()
+                if running.get(kind, 0) >= handler['concurrency']]
+        known = list(_handlers)  # Jobs of kinds this process can't run stay queued
+        claimed = conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ? "
+            'WHERE id = ('
+            '  SELECT id FROM jobs'
+            "  WHERE (status = 'queued' AND run_at <= ?"
+            "         OR status = 'running' AND lease_until < ?)"   # Its worker died
+            f"   AND kind IN ({', '.join('?' * len(known))})"
+            f"   AND kind NOT IN ({', '.join('?' * len(full))})"
+            '  ORDER BY priority DESC, run_at, id LIMIT 1) '
+            'RETURNING id, kind, payload, attempts, max_attempts',
+            (now + LEASE_SECONDS, now, now, *known, *full)
+        ).fetchall()  # Read RETURNING fully before COMMIT
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return claimed[0] if claimed else None
+
+
+def _finish(job, error=None):
+    now = time.time()
+    if error is None:
+        _store.connection().execute(
+            "UPDATE jobs SET status = 'done', error = NULL, finished_at = ? WHERE id = ?",
+            (now, job['id']))
+    elif job['attempts'] < job['max_attempts']:
+        # Try again later: 2s, 4s, 8s, ... (+ jitter so retries don't bunch up)
+        delay = min(BACKOFF_SECONDS * 2 ** (job['attempts'] - 1), MAX_BACKOFF_SECONDS)
+        _store.connection().execute(
+            "UPDATE jobs SET status = 'queued', error = ?, run_at = ? WHERE id = ?",
+            (error, now + delay * random.uniform(1, 1.5), job['id']))
+    else:
+        _store.connection().execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+            (error, now, job['id']))
+
+
+def _work(app):
+    """A worker thread. Errors of the queue itself are logged, never fatal."""
+    while True:
+        try:
+            if not _run_next_job(app):
+                _wake_up.wait(POLL_SECONDS)
+                _wake_up.clear()
+        except Exception:
+            # jobs.db was locked too long, disk full, ... - try again later
+            app.logger.exception('Job worker error, retrying in %s s', ERROR_PAUSE_SECONDS)
+            conn = _store.connection()
+            if conn.in_transaction:
+                conn.rollback()
+            time.sleep(ERROR_PAUSE_SECONDS)
+
+
+def _run_next_job(app):
+    """Claims, runs and finishes one job. Returns False if there was none."""
+    from models import db
+
+    job = _claim_next_job()
+    if job is None:
+        return False
+
+    def report(**progress):
+        """Saves progress and extends the lease (we're still alive)."""
+        _store.connection().execute(
+            'UPDATE jobs SET progress = ?, lease_until = ? WHERE id = ?',
+            (json.dumps(progress), time.time() + LEASE_SECONDS, job['id']))
+
+    with app.app_context():
+        try:
+            _handlers[job['kind']]['func'](json.loads(job['payload']), report)
+        except Exception as e:
+            app.logger.exception('Job %s (%s) failed', job['id'], job['kind'])
+            _finish(job, error=str(e))
+        else:
+            _finish(job)
+        finally:
+            db.session.remove()
+    return True
+
+
+# =============================================================================
+# STATUS (admin API) + CLEANUP
+# =============================================================================
+
+def _job_dict(row):
+    return {
+        'id': row['id'],
+        'kind': row['kind'],
+        'payload': json.loads(row['payload']),
+        'priority': row['priority'],
+        'status': row['status'],
+        'attempts': row['attempts'],
+        'max_attempts': row['max_attempts'],
+        'progress': json.loads(row['progress']) if row['progress'] else None,
+        'error': row['error'],
+        'created_at': row['created_at'],
+        'finished_at': row['finished_at'],
+    }
+
+
+def list_jobs(kind=None, status=None, limit=50):
+    """Newest jobs first, optionally only one kind and/or status."""
+    query, params = 'SELECT * FROM jobs WHERE 1 = 1', []
+    if kind:
+        query += ' AND kind = ?'
+        params.append(kind)
+    if status:
+        query += ' AND status = ?'
+        params.append(status)
+    query += ' ORDER BY id DESC LIMIT ?'
+    params.append(limit)
+    return [_job_dict(row) for row in _store.connection().execute(query, params)]
+
+
+def get_queue_status():
+    """Job counts per kind and status, plus each kind's limits."""
+    counts = {}
+    for kind, status, count in _store.connection().execute(
+            'SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status'):
+        counts.setdefault(kind, {})[status] = count
+    return {
+        kind: dict(counts.get(kind, {}), concurrency=handler['concurrency'],
+                   max_attempts=handler['max_attempts'])
+        for kind, handler in _handlers.items()
+    }
+
+
+def delete_finished_jobs():
+    """Called by the nightly maintenance job. Returns the number deleted."""
+    cutoff = time.time() - KEEP_FINISHED_DAYS * 86400
+    return _store.connection().execute(
+        "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,)
+    ).rowcount
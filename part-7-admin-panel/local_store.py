@@ -0,0 +1,48 @@
+# =============================================================================
+# Part 7: Local SQLite Stores
+# =============================================================================
+# The todo cache, the rate limiter and the job queue each keep a small SQLite
+# file in instance/ that every worker process on this machine shares.
+# They all need the same plumbing, so it lives here:
+#
+# - One connection per thread (SQLite connections can't be shared), opened
+#   again in a forked child instead of reusing the parent's.
+# - WAL journal mode, so readers never wait for writers.
+
+import os
+import sqlite3
+import threading
+
+
+class LocalStore:
+    """One SQLite file in instance/, with one connection per thread."""
+
+    def __init__(self, filename, timeout=1, durable=True, row_factory=None):
+        self.filename = filename
+        self.timeout = timeout          # Seconds to wait for another process's write
+        self.durable = durable          # False = PRAGMA synchronous = OFF
+        self.row_factory = row_factory
+        self.path = None
+        self._local = threading.local()
+
+    def open(self, app, schema):
+        """Creates the file (in WAL mode) and its tables."""
+        os.makedirs(app.instance_path, exist_ok=True)
+        self.path = os.path.join(app.instance_path, self.filename)
+
+        conn = self.connection()
+        conn.execute('PRAGMA journal_mode = WAL')  # Readers never wait for writers
+        conn.executescript(schema)
+
+    def connection(self):
+        """This thread's connection (a new one after a fork)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            if not self.durable:
+                conn.execute('PRAGMA synchronous = OFF')
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
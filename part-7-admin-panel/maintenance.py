@@ -0,0 +1,142 @@
+# =============================================================================
+# Part 7: Database Maintenance (trash cleanup, VACUUM, statistics)
+# =============================================================================
+# Deleting a todo only moves it to the trash (deleted_at is set). Once a day,
+# during quiet hours, a maintenance job (jobs.py) tidies up every shard:
+#
+#   0. The first time only: switches the file to auto_vacuum=INCREMENTAL.
+#      That needs one full VACUUM, which locks the file - so it happens
+#      here, at night, and not when the app starts.
+#   1. Hard-deletes todos that have been in the trash for TRASH_DAYS days,
+#      in small batches so other writers are never blocked for long.
+#   2. Moves todos completed more than ARCHIVE_AFTER_DAYS ago into the
+#      todos_archive table (see archive.py).
+#   3. PRAGMA incremental_vacuum - gives free pages back to the file system,
+#      so the .db file shrinks instead of only ever growing.
+#   4. PRAGMA optimize - refreshes the statistics SQLite uses to pick
+#      indexes, but only for tables that need it (a plain ANALYZE would read
+#      every table while holding a write lock).
+#
+# It also deletes expired refresh tokens and old finished jobs.
+#
+# Every app process has a scheduler thread, but they all queue the same job
+# (dedupe_key), so each host runs maintenance once a night.
+#
+# Admins can see the last run (and start one) at /api/admin/maintenance.
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+from archive import archive_completed_todos
+from jobs import register_job, enqueue, delete_finished_jobs, list_jobs
+from refresh_tokens import delete_expired_refresh_tokens
+from sharding import all_shard_keys
+from todo_cache import invalidate_todos
+
+TRASH_DAYS = 30         # Days a deleted todo can still be restored
+OFF_PEAK_HOUR = 3       # Run at 03:00 (server local time)
+BATCH_SIZE = 500        # Trash rows hard-deleted per transaction
+VACUUM_PAGES = 1000     # Free pages returned to the OS per incremental_vacuum
+
+
+
+def enable_incremental_vacuum(engine):
+    """
+    incremental_vacuum only works if auto_vacuum=INCREMENTAL. Switching an
+    existing file over needs one full VACUUM, so we only do it once.
+    Returns True if the file was converted now.
+    """
+    with engine.connect() as conn:
+        if conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() == 2:
+            return False
+        conn.exec_driver_sql('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.exec_driver_sql('VACUUM')
+        return True
+
+
+def start_maintenance_scheduler(app):
+    """Starts a thread that queues maintenance once a day at OFF_PEAK_HOUR."""
+    thread = threading.Thread(target=_scheduler, daemon=True)
+    thread.start()
+
+
+def seconds_until(hour):
+    """Seconds from now until the next hour:00 (server local time)."""
+    now = datetime.now()
+    next_run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+def _scheduler():
+    while True:
+        time.sleep(seconds_until(OFF_PEAK_HOUR))
+        start_maintenance()
+
+
+def start_maintenance():
+    """Queues a maintenance run (skipped if one is already queued or running)."""
+    return enqueue('maintenance', {}, dedupe_key='maintenance')
+
+
+def get_maintenance_status():
+    """The newest maintenance job (from any process) and its report."""
+    jobs = list_jobs(kind='maintenance', limit=1)
+    if not jobs:
+        return {'status': 'never run'}
+    job = jobs[0]
+    return dict(job['progress'] or {}, status=job['status'], job_id=job['id'], error=job['error'])
+
+
+# =============================================================================
+# THE MAINTENANCE JOB
+# =============================================================================
+
+def run_maintenance(report):
+    """Runs all maintenance steps on every shard (the 'maintenance' job)."""
+    from models import db
+
+    started_at = datetime.utcnow().isoformat()
+    purged = archived = converted = 0
+    for key in all_shard_keys():
+        engine = db.engines[key]
+        converted += enable_incremental_vacuum(engine)
+        purged += _purge_expired_trash(engine)
+        archived += archive_completed_todos(engine)
+        with engine.connect() as conn:
+            conn.exec_driver_sql(f'PRAGMA incremental_vacuum({VACUUM_PAGES})')
+            conn.exec_driver_sql('PRAGMA optimize')
+        report(started_at=started_at, purged_todos=purged, archived_todos=archived)
+    if archived:
+        invalidate_todos()  # Archived todos left many users' lists
+    report(started_at=started_at, purged_todos=purged, archived_todos=archived,
+           converted_to_incremental_vacuum=converted,
+           expired_refresh_tokens=delete_expired_refresh_tokens(),
+           deleted_jobs=delete_finished_jobs(),
+           finished_at=datetime.utcnow().isoformat())
+
+
+def _maintenance_job(payload, report):
+    run_maintenance(report)
+
+
+register_job('maintenance', _maintenance_job, concurrency=1, max_attempts=3)
+
+
+def _purge_expired_trash(engine):
+    """Hard-deletes expired trash in batches. Returns the number deleted."""
+    cutoff = datetime.utcnow() - timedelta(days=TRASH_DAYS)
+    purged = 0
+    while True:
+        with engine.begin() as conn:  # One short transaction per batch
+            result = conn.exec_driver_sql(
+                'DELETE FROM todos WHERE id IN ('
+                '  SELECT id FROM todos WHERE deleted_at IS NOT NULL AND deleted_at < ?'
+                '  LIMIT ?)',
+                (cutoff.isoformat(sep=' '), BATCH_SIZE)
+            )
+        purged += result.rowcount
+        if result.rowcount < BATCH_SIZE:
+            return purged
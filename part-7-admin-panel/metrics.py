@@ -0,0 +1,288 @@
+# =============================================================================
+# Part 7: Metrics (Prometheus format at /metrics)
+# =============================================================================
+# Tells you, while the app runs, how fast each route is and where time goes:
+#
+#   todo_http_requests_total               requests per endpoint/method/status
+#   todo_http_request_duration_seconds     latency histogram per endpoint
+#   todo_http_requests_in_flight           requests being handled right now
+#   todo_db_time_per_request_seconds       time spent in SQL, per request
+#   todo_db_pool_checkouts_total           connections taken from the pool
+#   todo_db_pool_overflow_checkouts_total  ...beyond pool_size
+#   todo_db_pool_wait_seconds              how long getting a connection took
+#   todo_kdf_in_progress                   password hashes running right now
+#   todo_kdf_duration_seconds              how long each hash takes
+#   todo_cache_requests_total              cache hits/misses per cache
+#   todo_reminders_total                   due-date reminders sent
+#
+# With several worker processes (gunicorn -w 4), each one keeps its numbers
+# in memory and writes them to instance/metrics/<pid>.json every few
+# seconds. /metrics adds all the files together - no extra service needed.
+
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import request, g, Response, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FLUSH_INTERVAL = 5  # Seconds between writes of this process's metrics file
+
+HELP = {
+    'todo_http_requests_total': ('counter', 'HTTP requests handled'),
+    'todo_http_request_duration_seconds': ('histogram', 'Request latency'),
+    'todo_http_requests_in_flight': ('gauge', 'Requests being handled right now'),
+    'todo_db_time_per_request_seconds': ('histogram', 'Time spent in SQL per request'),
+    'todo_db_pool_checkouts_total': ('counter', 'Connections checked out of the pool'),
+    'todo_db_pool_overflow_checkouts_total': ('counter', 'Checkouts beyond pool_size'),
+    'todo_db_pool_wait_seconds': ('histogram', 'Time waiting for a connection from the pool'),
+    'todo_kdf_in_progress': ('gauge', 'Password hash operations running right now'),
+    'todo_kdf_duration_seconds': ('histogram', 'Time per password hash operation'),
+    'todo_cache_requests_total': ('counter', 'Cache lookups by result'),
+    'todo_reminders_total': ('counter', 'Due-date reminders sent'),
+}
+
+_lock = threading.Lock()
+_counters = defaultdict(float)    # (name, labels) -> value
+_gauges = defaultdict(float)      # (name, labels) -> value
+_histograms = {}                  # (name, labels) -> [count <= each bucket..., sum, count]
+_metrics_dir = None
+_flusher_pid = None               # Process that owns the running flush thread
+
+
+# =============================================================================
+# RECORDING
+# =============================================================================
+# labels are passed as keyword arguments: inc('x_total', endpoint='login')
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    with _lock:
+        _counters[_key(name, labels)] += amount
+
+
+def gauge_add(name, amount, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] += amount
+
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        buckets = _histograms.setdefault(key, [0] * (len(BUCKETS) + 2))
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                buckets[i] += 1
+        buckets[-2] += value
+        buckets[-1] += 1
+
+
+def cache_lookup(cache, hit):
+    """Call from any cache: cache_lookup('pages', hit=True)."""
+    inc('todo_cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+@contextmanager
+def track_kdf():
+    """Wrap password hashing: with track_kdf(): generate_password_hash(...)"""
+    gauge_add('todo_kdf_in_progress', 1)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('todo_kdf_duration_seconds', time.perf_counter() - started)
+        gauge_add('todo_kdf_in_progress', -1)
+
+
+# =============================================================================
+# HOOKS: requests, SQL statements, connection pool
+# =============================================================================
+
+def _before_request():
+    if _flusher_pid != os.getpid():
+        _start_flusher()  # First request in this (maybe forked) worker
+    g.metrics_started = time.perf_counter()
+    g.db_seconds = 0.0
+    gauge_add('todo_http_requests_in_flight', 1)
+
+
+def _after_request(response):
+    if 'metrics_started' in g:
+        endpoint = request.endpoint or 'none'
+        observe('todo_http_request_duration_seconds',
+                time.perf_counter() - g.metrics_started, endpoint=endpoint)
+        observe('todo_db_time_per_request_seconds', g.db_seconds, endpoint=endpoint)
+        inc('todo_http_requests_total', endpoint=endpoint,
+            method=request.method, status=str(response.status_code))
+    return response
+
+
+def _teardown_request(exc):
+    if g.pop('metrics_started', None) is not None:
+        gauge_add('todo_http_requests_in_flight', -1)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_sql(conn, cursor, statement, parameters, context, executemany):
+    conn.info['metrics_sql_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_sql(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('metrics_sql_started', None)
+    if started is not None and has_app_context() and 'db_seconds' in g:
+        g.db_seconds += time.perf_counter() - started
+
+
+def _watch_pool(name, pool):
+    """Counts checkouts of one engine's connection pool and times them."""
+    # The pool has no "checkout started" event, so we wrap pool.connect():
+    # the time spent in it is how long the request waited for a connection
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            observe('todo_db_pool_wait_seconds', time.perf_counter() - started, engine=name)
+
+    pool.connect = timed_connect
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        inc('todo_db_pool_checkouts_total', engine=name)
+        if hasattr(pool, 'size') and pool.checkedout() > pool.size():
+            inc('todo_db_pool_overflow_checkouts_total', engine=name)
+
+    event.listen(pool, 'checkout', on_checkout)
+
+
+# =============================================================================
+# SHARING BETWEEN WORKER PROCESSES
+# =============================================================================
+
+def _snapshot():
+    with _lock:
+        return {
+            'counters': [[n, l, v] for (n, l), v in _counters.items()],
+            'gauges': [[n, l, v] for (n, l), v in _gauges.items()],
+            'histograms': [[n, l, v] for (n, l), v in _histograms.items()],
+        }
+
+
+def _flush():
+    """Writes this process's metrics to instance/metrics/<pid>.json."""
+    path = os.path.join(_metrics_dir, f'{os.getpid()}.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(_snapshot(), f)
+    os.replace(path + '.tmp', path)  # Readers never see half a file
+
+
+def _flush_forever():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        _flush()
+
+
+def _start_flusher():
+    global _flusher_pid
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_forever, daemon=True).start()
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+
+def _collect_all_processes():
+    """Adds up the metrics of every worker (this one live, others from files)."""
+    counters, gauges, histograms = defaultdict(float), defaultdict(float), {}
+    snapshots = [_snapshot()]
+
+    for filename in os.listdir(_metrics_dir):
+        if not filename.endswith('.json') or filename == f'{os.getpid()}.json':
+            continue
+        try:
+            with open(os.path.join(_metrics_dir, filename)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if not _process_alive(int(filename[:-5])):
+            snapshot['gauges'] = []  # A dead worker has nothing in flight
+        snapshots.append(snapshot)
+
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            counters[name, tuple(map(tuple, labels))] += value
+        for name, labels, value in snapshot['gauges']:
+            gauges[name, tuple(map(tuple, labels))] += value
+        for name, labels, values in snapshot['histograms']:
+            total = histograms.setdefault((name, tuple(map(tuple, labels))), [0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+    return counters, gauges, histograms
+
+
+# =============================================================================
+# /metrics (Prometheus text format)
+# =============================================================================
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+def render_metrics():
+    counters, gauges, histograms = _collect_all_processes()
+    lines = []
+    for name, (kind, help_text) in HELP.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'histogram':
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(BUCKETS, values):
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {count}')
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {values[-1]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {values[-2]}')
+                lines.append(f'{name}_count{_format_labels(labels)} {values[-1]}')
+        else:
+            source = counters if kind == 'counter' else gauges
+            for (metric, labels), value in sorted(source.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    global _metrics_dir
+    _metrics_dir = os.path.join(app.instance_path, 'metrics')
+    os.makedirs(_metrics_dir, exist_ok=True)
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/metrics', 'metrics', render_metrics)
+
+    from models import db
+    with app.app_context():
+        for key, engine in db.engines.items():
+            _watch_pool(key or 'default', engine.pool)
@@ -1,7 +1,16 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from sharding import ShardedSession, DIRECTORY_BIND, next_todo_id
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': ShardedSession})  # NEW: shard-aware session
+
+# Share of a user's todos that are done (0.0 - 1.0). It has an expression
+# index, and SQLite only uses it for queries with exactly this expression.
+COMPLETION_RATE_SQL = 'CASE WHEN total_todos = 0 THEN 0.0 ELSE completed_todos * 1.0 / total_todos END'
+
+# Todos with a due date that are still open. Queries must repeat these
+# conditions for SQLite to use the partial indexes built on them.
+OPEN_DUE_TODOS_SQL = 'due_at IS NOT NULL AND is_completed = 0 AND deleted_at IS NULL'
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -11,9 +20,16 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)  # NEW: Admin flag
+    is_disabled = db.Column(db.Boolean, default=False)  # Set while being deleted
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Todo counters (trash excluded, archive included), kept up to date by
+    # SQLite triggers - see admin_users.py
+    total_todos = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    completed_todos = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
     todos = db.relationship('Todo', backref='user', lazy=True)
+    archived_todos = db.relationship('ArchivedTodo', lazy='dynamic')  # Query, not list
 
     def to_dict(self):
         return {
@@ -26,27 +42,73 @@ class User(db.Model):
 
     # NEW: For admin panel - include user statistics
     def to_dict_with_stats(self):
-        total_todos = len(self.todos)
-        completed_todos = len([t for t in self.todos if t.is_completed])
         return {
             'id': self.id,
             'username': self.username,
             'email': self.email,
             'is_admin': self.is_admin,
+            'is_disabled': self.is_disabled,
             'created_at': self.created_at.isoformat(),
-            'total_todos': total_todos,
-            'completed_todos': completed_todos
+            'total_todos': self.total_todos,
+            'completed_todos': self.completed_todos,
+            'completion_rate': self.completed_todos / self.total_todos if self.total_todos else 0.0
         }
 
+    # Indexes for the admin user list: search by name/email prefix, and
+    # page through users sorted by join date, todo count or completion rate
+    __table_args__ = (
+        db.Index('ix_users_username_lower', db.func.lower(username)),
+        db.Index('ix_users_email_lower', db.func.lower(email)),
+        db.Index('ix_users_created_at', 'created_at', 'id'),
+        db.Index('ix_users_total_todos', 'total_todos', 'id'),
+        db.Index('ix_users_completion_rate', db.text(COMPLETION_RATE_SQL), 'id'),
+    )
+
 
 class Todo(db.Model):
     __tablename__ = 'todos'
 
-    id = db.Column(db.Integer, primary_key=True)
+    # Unique across ALL shards (handed out by the directory, see sharding.py),
+    # so a todo id alone never points at somebody else's todo on another shard
+    id = db.Column(db.Integer, primary_key=True, default=next_todo_id)
     task_content = db.Column(db.String(200), nullable=False)
     is_completed = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    completed_at = db.Column(db.DateTime, nullable=True)  # When it was ticked off
+    deleted_at = db.Column(db.DateTime, nullable=True)  # Set = in the trash
+    due_at = db.Column(db.DateTime, nullable=True)  # Optional deadline (UTC)
+    reminded_at = db.Column(db.DateTime, nullable=True)  # When the reminder went out
+    rank = db.Column(db.String(64), nullable=True)  # Position in the list (see ranking.py)
+
+    # Subtasks (see subtasks.py): the parent, and roll-ups of all live subtasks below
+    parent_id = db.Column(db.Integer, db.ForeignKey('todos.id'), nullable=True)
+    subtask_total = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    subtask_done = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
+    # Shared list this todo is on (see sharing.py). Its todos are stored with
+    # the list owner's todos, so user_id is the owner.
+    list_id = db.Column(db.Integer, nullable=True)
+
+    # One extra query loads the tags of every todo in a list (not one per todo)
+    tags = db.relationship('Tag', secondary='todo_tags', lazy='selectin', order_by='Tag.name')
+
+    # Partial indexes: only cover the rows their queries look for, so they stay small
+    __table_args__ = (
+        db.Index('ix_todos_user_active', 'user_id', sqlite_where=db.text('deleted_at IS NULL')),
+        # The user's list in order, and the neighbours of a moved todo
+        db.Index('ix_todos_user_rank', 'user_id', 'rank'),
+        # A todo's subtasks (most todos have no parent, so they aren't in it)
+        db.Index('ix_todos_parent', 'parent_id', sqlite_where=db.text('parent_id IS NOT NULL')),
+        # The todos of a shared list, in order
+        db.Index('ix_todos_list_rank', 'list_id', 'rank', sqlite_where=db.text('list_id IS NOT NULL')),
+        # "What's due soon?" for one user (GET /api/todos?due_before=...)
+        db.Index('ix_todos_user_due', 'user_id', 'due_at',
+                 sqlite_where=db.text(OPEN_DUE_TODOS_SQL)),
+        # Reminders still to send, in due order (see reminders.py)
+        db.Index('ix_todos_reminders', 'due_at',
+                 sqlite_where=db.text(f'{OPEN_DUE_TODOS_SQL} AND reminded_at IS NULL')),
+    )
 
     def to_dict(self):
         return {
@@ -54,5 +116,218 @@ class Todo(db.Model):
             'task_content': self.task_content,
             'is_completed': self.is_completed,
             'created_at': self.created_at.isoformat(),
-            'user_id': self.user_id
+            'user_id': self.user_id,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'deleted_at': self.deleted_at.isoformat() if self.deleted_at else None,
+            'due_at': self.due_at.isoformat() if self.due_at else None,
+            'rank': self.rank,
+            'parent_id': self.parent_id,
+            'subtask_total': self.subtask_total,
+            'subtask_done': self.subtask_done,
+            'list_id': self.list_id,
+            'tags': [tag.name for tag in self.tags]
+        }
+
+
+# NEW: Tags (labels) on todos - see tags.py. Each user has their own tags.
+class Tag(db.Model):
+    __tablename__ = 'tags'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    name = db.Column(db.String(30), nullable=False)
+    # Live todos with this tag, kept up to date by SQLite triggers (tags.py)
+    todo_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_tags_user_name', 'user_id', 'name', unique=True),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'todo_count': self.todo_count
+        }
+
+
+# Which todo has which tag. The primary key (todo_id, tag_id) finds a todo's
+# tags; ix_todo_tags_tag (tag_id, todo_id) finds a tag's todos.
+class TodoTag(db.Model):
+    __tablename__ = 'todo_tags'
+
+    todo_id = db.Column(db.Integer, db.ForeignKey('todos.id'), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tags.id'), primary_key=True)
+
+    __table_args__ = (
+        db.Index('ix_todo_tags_tag', 'tag_id', 'todo_id'),
+    )
+
+
+# NEW: Old completed todos are moved here (see archive.py), so the todos
+# table - which every page load reads - only holds the todos people still use.
+class ArchivedTodo(db.Model):
+    __tablename__ = 'todos_archive'
+
+    id = db.Column(db.Integer, primary_key=True)
+    todo_id = db.Column(db.Integer, nullable=False)  # Its id in the todos table
+    task_content = db.Column(db.String(200), nullable=False)
+    created_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # The todo's tag names, comma-separated (its todo_tags rows are deleted)
+    tags = db.Column(db.Text)
+
+    __table_args__ = (
+        db.Index('ix_todos_archive_user', 'user_id', 'id'),
+        # The user's export merges live and archived todos in todo id order
+        db.Index('ix_todos_archive_user_todo', 'user_id', 'todo_id'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'todo_id': self.todo_id,
+            'task_content': self.task_content,
+            'is_completed': True,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'archived_at': self.archived_at.isoformat(),
+            'user_id': self.user_id,
+            'tags': self.tags.split(',') if self.tags else []
+        }
+
+
+# NEW: Directory of all users (lives in its own small database, see sharding.py)
+class UserDirectory(db.Model):
+    __tablename__ = 'user_directory'
+    __bind_key__ = DIRECTORY_BIND
+
+    id = db.Column(db.Integer, primary_key=True)  # Global user id
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+
+    # Case-insensitive uniqueness: "Alice" and "alice" are the same user
+    __table_args__ = (
+        db.Index('ix_user_directory_email_lower', db.func.lower(email), unique=True),
+        db.Index('ix_user_directory_username_lower', db.func.lower(username), unique=True),
+    )
+
+
+# NEW: Counters for ids that must be unique across shards (see next_todo_id)
+class IdSequence(db.Model):
+    __tablename__ = 'id_sequences'
+    __bind_key__ = DIRECTORY_BIND
+
+    name = db.Column(db.String(30), primary_key=True)
+    next_id = db.Column(db.Integer, nullable=False)
+
+
+# NEW: Shared lists (see sharing.py). Lists and memberships are in the
+# directory database: members can be on any shard.
+class TodoList(db.Model):
+    __tablename__ = 'todo_lists'
+    __bind_key__ = DIRECTORY_BIND
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    owner_id = db.Column(db.Integer, nullable=False)  # Its todos live on the owner's shard
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_todo_lists_owner', 'owner_id'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'owner_id': self.owner_id,
+            'created_at': self.created_at.isoformat()
         }
+
+
+class ListMember(db.Model):
+    __tablename__ = 'list_members'
+    __bind_key__ = DIRECTORY_BIND
+
+    list_id = db.Column(db.Integer, db.ForeignKey('todo_lists.id'), primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+    role = db.Column(db.String(10), nullable=False)  # owner | editor | viewer
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # "Which lists can this user see, with which role?" reads only this index
+    __table_args__ = (
+        db.Index('ix_list_members_user', 'user_id', 'list_id', 'role'),
+    )
+
+
+# NEW: Refresh tokens (also in the directory database, so a token can be
+# looked up without knowing the user's shard). Only a SHA-256 of the token
+# is stored: a stolen database copy can't be used to sign in.
+class RefreshToken(db.Model):
+    __tablename__ = 'refresh_tokens'
+    __bind_key__ = DIRECTORY_BIND
+
+    id = db.Column(db.Integer, primary_key=True)
+    token_hash = db.Column(db.String(64), nullable=False)
+    family_id = db.Column(db.String(32), nullable=False)  # Same for every rotation of one login
+    user_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    used_at = db.Column(db.DateTime)                      # Set once it is swapped for a new one
+    is_revoked = db.Column(db.Boolean, default=False, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_refresh_tokens_hash', 'token_hash', unique=True),  # One index lookup per refresh
+        db.Index('ix_refresh_tokens_family', 'family_id'),
+        db.Index('ix_refresh_tokens_user', 'user_id'),
+        db.Index('ix_refresh_tokens_expires', 'expires_at'),
+    )
+
+
+# Adds columns and indexes that were added to the models after the database
+# file was created (db.create_all() only creates missing TABLES).
+def upgrade_schema(engine, metadata=None):
+    metadata = metadata if metadata is not None else db.metadata
+    with engine.begin() as conn:
+        # (Read index names directly: SQLAlchemy can't see expression indexes)
+        indexes = {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        for table in metadata.sorted_tables:
+            existing = {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info({table.name})')}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(engine.dialect)
+                    if column.server_default is not None:
+                        column_type += f' DEFAULT {column.server_default.arg}'
+                    conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
+
+
+# =============================================================================
+# REGISTRATION HELPERS
+# =============================================================================
+
+# ONE cheap query checks both email and username (case-insensitive), so we
+# never spend CPU on hashing a password for a duplicate registration.
+def find_registration_conflict(username, email):
+    taken = UserDirectory.query.filter(db.or_(
+        db.func.lower(UserDirectory.email) == email.lower(),
+        db.func.lower(UserDirectory.username) == username.lower()
+    )).first()
+    if taken is None:
+        return None
+    if taken.email.lower() == email.lower():
+        return 'Email already registered'
+    return 'Username already taken'
+
+
+# If two people register at the same moment, the unique indexes stop the
+# second INSERT. This turns that IntegrityError into the usual message.
+def registration_error_message(error):
+    if 'email' in str(error.orig):
+        return 'Email already registered'
+    return 'Username already taken'
@@ -0,0 +1,64 @@
+# =============================================================================
+# Part 7: Page Cache (render each template once per process)
+# =============================================================================
+# Our HTML pages have no {{ variables }} - they are the same for every user.
+# Calling render_template() on every request would redo the same Jinja work
+# each time, so instead:
+#
+#   1. Each page is rendered ONCE and kept in memory (already compressed).
+#   2. The browser gets an ETag + Cache-Control header, so it can reuse its
+#      own copy and only ask "has it changed?" after max-age runs out.
+#   3. If a template file is edited (its mtime changes), the page is
+#      re-rendered - the new content gets a new ETag (cache busting).
+#   4. Compiled templates are saved to instance/jinja_cache, so a fresh
+#      process can skip parsing the templates again (faster cold start).
+
+import os
+
+from flask import render_template
+from jinja2 import FileSystemBytecodeCache
+
+from compression import StaticPage, serve_static_page
+from metrics import cache_lookup
+
+PAGE_MAX_AGE = 3600  # Seconds the browser may reuse a page without asking
+
+
+def enable_template_bytecode_cache(app):
+    """Stores compiled templates on disk. Call before rendering anything."""
+    cache_dir = os.path.join(app.instance_path, 'jinja_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+
+class PageCache:
+    """Rendered + compressed pages, keyed by template name."""
+
+    def __init__(self, app, template_names, max_age=PAGE_MAX_AGE):
+        self.app = app
+        self.max_age = max_age
+        self.pages = {}
+        self.mtimes = {}
+        for name in template_names:
+            self._render(name)
+
+    def _template_mtime(self, name):
+        path = os.path.join(self.app.root_path, self.app.template_folder, name)
+        return os.stat(path).st_mtime
+
+    def _render(self, name):
+        self.mtimes[name] = self._template_mtime(name)
+        self.pages[name] = StaticPage(render_template(name).encode('utf-8'))
+
+    def serve(self, name):
+        """Returns the cached page, re-rendering it if the file changed."""
+        changed = self._template_mtime(name) != self.mtimes[name]
+        cache_lookup('pages', hit=not changed)
+        if changed:
+            self.app.jinja_env.cache.clear()  # Make Jinja re-read the file
+            self._render(name)
+
+        response = serve_static_page(self.pages[name])
+        response.cache_control.public = True
+        response.cache_control.max_age = self.max_age
+        return response
@@ -0,0 +1,94 @@
+# =============================================================================
+# Part 7: On-Demand Request Profiler (admins only)
+# =============================================================================
+# When one route is slow, add ?profile=1 (or the header "X-Profile: 1") to
+# the request while logged in as an admin. Instead of the normal response
+# you get a .pstats file you can open with:
+#
+#     python -m pstats profile-get_all_users.pstats
+#     snakeviz profile-get_all_users.pstats        (pip install snakeviz)
+#
+# Use ?profile=text for a readable report in the browser instead.
+# Every profile also says how much time went to SQL vs Python code.
+#
+# Requests without the flag only pay for one dictionary lookup.
+# Note: work done in other threads (e.g. fan_out over shards) isn't profiled.
+
+import cProfile
+import io
+import marshal
+import pstats
+import time
+
+from flask import request, g, make_response
+
+from auth import get_admin_user
+
+TOP_FUNCTIONS = 30  # Rows in the text report
+
+
+def init_profiler(app):
+    app.before_request(start_profiling)
+    app.after_request(finish_profiling)
+
+
+def _profile_flag():
+    return request.args.get('profile') or request.headers.get('X-Profile')
+
+
+def start_profiling():
+    if not _profile_flag():
+        return  # The normal case: no profiling, no cost
+
+    current_user, error = get_admin_user()
+    if error:
+        return  # Not an admin: ignore the flag, serve the request normally
+
+    g.profile_started = time.perf_counter()
+    g.profiler = cProfile.Profile()
+    g.profiler.enable()
+
+
+def _sql_seconds(stats):
+    """Time spent inside sqlite3's execute/executemany (= waiting on SQL)."""
+    total = 0.0
+    for (filename, line, name), (cc, nc, tt, ct, callers) in stats.stats.items():
+        if filename == '~' and 'sqlite3.Cursor' in name and 'execute' in name:
+            total += tt
+    return total
+
+
+def finish_profiling(response):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+
+    profiler.disable()
+    total = time.perf_counter() - g.pop('profile_started')
+    stats = pstats.Stats(profiler)
+    sql = _sql_seconds(stats)
+
+    summary = {
+        'X-Profile-Total-Ms': f'{total * 1000:.1f}',
+        'X-Profile-SQL-Ms': f'{sql * 1000:.1f}',
+        'X-Profile-Python-Ms': f'{(total - sql) * 1000:.1f}',
+    }
+
+    if _profile_flag() == 'text':
+        report = io.StringIO()
+        report.write(f'{request.method} {request.path} -> {response.status_code}\n')
+        report.write(f'total {summary["X-Profile-Total-Ms"]} ms = '
+                     f'SQL {summary["X-Profile-SQL-Ms"]} ms + '
+                     f'Python {summary["X-Profile-Python-Ms"]} ms\n\n')
+        stats.stream = report
+        stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        profile_response = make_response(report.getvalue())
+        profile_response.mimetype = 'text/plain'
+    else:
+        profile_response = make_response(marshal.dumps(stats.stats))
+        profile_response.mimetype = 'application/octet-stream'
+        profile_response.headers['Content-Disposition'] = (
+            f'attachment; filename=profile-{request.endpoint}.pstats')
+
+    profile_response.headers.update(summary)
+    return profile_response
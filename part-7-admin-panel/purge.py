@@ -0,0 +1,87 @@
+# =============================================================================
+# Part 7: Background User Purge
+# =============================================================================
+# Deleting a user with 100,000 todos in ONE transaction holds SQLite's write
+# lock for seconds, and every other user has to wait. Instead:
+#
+#   1. delete_user marks the user as disabled (they can't log in any more)
+#      and returns immediately.
+#   2. A background job deletes their todos in small batches, each batch
+#      in its own short transaction, so other writers can get in between.
+#   3. Finally it deletes the user row and their directory entry.
+#
+# The purge is a job in the durable job queue (jobs.py), so it survives a
+# restart and is retried if it fails. Admins can watch the progress at
+# GET /api/admin/purges.
+
+import time
+
+from jobs import register_job, enqueue, list_jobs
+from sharding import use_shard, fan_out
+from sharing import delete_user_lists
+
+BATCH_SIZE = 500      # Todos deleted per transaction
+BATCH_PAUSE = 0.01    # Seconds to wait between batches (lets others write)
+PURGE_PRIORITY = 10   # Ahead of routine jobs such as backups
+
+
+def resume_purges():
+    """Queues purges for users disabled before the job queue existed."""
+    from models import User
+
+    def disabled_users():
+        return [(u.id, u.username) for u in User.query.filter_by(is_disabled=True)]
+
+    for users in fan_out(disabled_users):
+        for user_id, username in users:
+            schedule_purge(user_id, username)  # Already queued ones are skipped
+
+
+def schedule_purge(user_id, username):
+    enqueue('purge_user', {'user_id': user_id, 'username': username},
+            priority=PURGE_PRIORITY, dedupe_key=f'purge_user:{user_id}')
+
+
+def get_purge_status():
+    return [
+        {
+            'user_id': job['payload']['user_id'],
+            'username': job['payload']['username'],
+            'status': job['status'],
+            'deleted_todos': (job['progress'] or {}).get('deleted_todos', 0),
+            'error': job['error'],
+        }
+        for job in list_jobs(kind='purge_user')
+    ]
+
+
+def _purge_user(payload, report):
+    from models import db, User, Todo, ArchivedTodo, Tag, UserDirectory, RefreshToken
+
+    user_id = payload['user_id']
+    use_shard(user_id)
+
+    # Step 1: Delete todos in small batches, one short transaction each
+    deleted = 0
+    while True:
+        ids = [row.id for row in
+               Todo.query.with_entities(Todo.id).filter_by(user_id=user_id).limit(BATCH_SIZE)]
+        if not ids:
+            break
+        Todo.query.filter(Todo.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(ids)
+        report(deleted_todos=deleted)
+        time.sleep(BATCH_PAUSE)
+
+    # Step 2: Delete the user's archive, the user, and free their email/username
+    ArchivedTodo.query.filter_by(user_id=user_id).delete()
+    Tag.query.filter_by(user_id=user_id).delete()  # Their todo_tags rows went with the todos
+    User.query.filter_by(id=user_id).delete()
+    UserDirectory.query.filter_by(id=user_id).delete()
+    RefreshToken.query.filter_by(user_id=user_id).delete()
+    delete_user_lists(user_id)  # Their memberships and the lists they own
+    db.session.commit()
+
+
+register_job('purge_user', _purge_user, concurrency=1)
@@ -0,0 +1,209 @@
+# =============================================================================
+# Part 7: Manual Ordering (drag and drop) with Fractional Ranks
+# =============================================================================
+# Each todo has a RANK: a short string, and the list is sorted by it.
+# Storing positions 1, 2, 3, ... would mean that moving a todo to the top
+# renumbers every todo below it. Ranks are "fractions" instead, written in
+# base 62 (0-9, A-Z, a-z - the same order as string comparison):
+#
+#   "V" = 0.V (about 1/2), "k" = 0.k (about 3/4), "VV" = 0.VV, ...
+#
+# Between any two ranks there is always another one ("V" < "d" < "k"), so a
+# move changes ONE row:
+#
+#   PATCH /api/todos/7/move   {"after_id": 3}    right after todo 3
+#                             {"after_id": null} to the top
+#                             {"before_id": 5}   right before todo 5
+#                             {"before_id": null} to the bottom
+#
+# Many moves into the same gap make ranks longer (about one character per
+# six moves). When a rank gets longer than MAX_RANK_LENGTH, a background job
+# gives all of the user's todos short, evenly spaced ranks again.
+
+from flask import jsonify
+
+from jobs import register_job, enqueue
+from sharding import shard_for, fan_out
+
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+MAX_RANK_LENGTH = 12  # Longer ranks trigger a rebalance
+REBALANCE_PRIORITY = 5
+
+
+# =============================================================================
+# RANK KEYS
+# =============================================================================
+# Ranks never end in "0" ("V0" would equal "V"), so string order and
+# number order are the same.
+
+def key_between(low, high):
+    """A rank between low and high (None = the start / the end of the list)."""
+    low = low or ''
+    rank = ''
+    for position in range(max(len(low), len(high or '')) + 2):
+        low_digit = DIGITS.index(low[position]) if position < len(low) else 0
+        high_digit = DIGITS.index(high[position]) if high is not None and position < len(high) else BASE
+        if high_digit - low_digit > 1:
+            return rank + DIGITS[(low_digit + high_digit) // 2]
+        # No room at this position: copy low's digit and keep going. From
+        # here on anything is below high, so high no longer limits us.
+        rank += DIGITS[low_digit]
+        if high_digit - low_digit == 1:
+            high = None
+    raise ValueError(f'No rank between {low!r} and {high!r}')
+
+
+def even_keys(count):
+    """count ranks, evenly spaced and as short as possible."""
+    length = 1
+    while BASE ** length < (count + 1) * BASE:  # Leave ~62 ranks between neighbours
+        length += 1
+    step = BASE ** length // (count + 1)
+
+    keys = []
+    for number in range(1, count + 1):
+        value, digits = number * step, ''
+        for _ in range(length):
+            value, digit = divmod(value, BASE)
+            digits = DIGITS[digit] + digits
+        keys.append(digits.rstrip('0'))
+    return keys
+
+
+# =============================================================================
+# USING RANKS
+# =============================================================================
+
+def _neighbour_rank(user_id, rank, below, exclude_ids):
+    """
+    The closest rank at or below/above `rank` (None = from the end/start).
+    One step on the ix_todos_user_rank index.
+    """
+    from models import Todo
+
+    query = Todo.query.with_entities(Todo.rank).filter(
+        Todo.user_id == user_id, Todo.rank.isnot(None), Todo.id.notin_(exclude_ids))
+    if below:
+        if rank is not None:
+            query = query.filter(Todo.rank <= rank)
+        query = query.order_by(Todo.rank.desc())
+    else:
+        if rank is not None:
+            query = query.filter(Todo.rank >= rank)
+        query = query.order_by(Todo.rank)
+    return query.limit(1).scalar()
+
+
+def rank_for_new_todo(user_id):
+    """New todos go to the bottom of the list."""
+    return key_between(_neighbour_rank(user_id, None, True, []), None)
+
+
+def _new_rank(todo, data):
+    """
+    Works out the todo's new rank from the move request.
+    Returns: (rank, None), (None, None) if the ranks need a rebalance first,
+    or (None, error_response)
+    """
+    from models import Todo
+
+    place = 'after' if 'after_id' in data else 'before' if 'before_id' in data else None
+    if place is None:
+        return None, (jsonify({'error': 'after_id or before_id is required'}), 400)
+
+    anchor = None
+    anchor_id = data[f'{place}_id']
+    if anchor_id is not None:
+        anchor = Todo.query.filter_by(id=anchor_id, user_id=todo.user_id).first()
+        if anchor is None or anchor.id == todo.id:
+            return None, (jsonify({'error': f'Invalid {place}_id'}), 400)
+
+    # Not ranked yet (todos from before ranks, or just imported)
+    if Todo.query.filter_by(user_id=todo.user_id, rank=None).first() is not None:
+        return None, None
+
+    exclude = [todo.id] + ([anchor.id] if anchor else [])
+    if place == 'after':
+        low = anchor.rank if anchor else None  # after nothing = the top
+        high = _neighbour_rank(todo.user_id, low or '', False, exclude)
+    else:
+        high = anchor.rank if anchor else None  # before nothing = the bottom
+        low = _neighbour_rank(todo.user_id, high, True, exclude)
+
+    if low is not None and high is not None and low >= high:
+        return None, None  # Two todos share a rank (added at the same moment)
+    return key_between(low, high), None
+
+
+def move_todo(todo, data):
+    """
+    Body of PATCH /api/todos/<id>/move: updates this ONE todo's rank.
+    Returns: (todo, None) on success, (None, error_response) on failure
+    """
+    from models import db
+
+    rank, error = _new_rank(todo, data)
+    if error:
+        return None, error
+    if rank is None:
+        rebalance_ranks(todo.user_id)  # Rare: fix the ranks now, then try again
+        db.session.expire_all()        # Forget the ranks we loaded before
+        rank, error = _new_rank(todo, data)
+        if error:
+            return None, error
+
+    todo.rank = rank
+    db.session.commit()
+    if len(rank) > MAX_RANK_LENGTH:
+        schedule_rebalance(todo.user_id)
+    return todo, None
+
+
+# =============================================================================
+# REBALANCING (background job)
+# =============================================================================
+
+def schedule_rebalance(user_id):
+    enqueue('rebalance_ranks', {'user_id': user_id}, priority=REBALANCE_PRIORITY,
+            dedupe_key=f'rebalance_ranks:{user_id}')
+
+
+def rebalance_ranks(user_id):
+    """
+    Gives all of a user's todos (trash included) new, short ranks in their
+    current order. Todos without a rank go last, oldest first.
+    """
+    from models import db
+    from todo_cache import invalidate_todos
+
+    with db.engines[shard_for(user_id)].connect() as conn:
+        conn.exec_driver_sql('BEGIN IMMEDIATE')  # Moves wait until we're done
+        ids = [row[0] for row in conn.exec_driver_sql(
+            'SELECT id FROM todos WHERE user_id = ? ORDER BY rank IS NULL, rank, id', (user_id,))]
+        if ids:
+            conn.exec_driver_sql('UPDATE todos SET rank = ? WHERE id = ?',
+                                 list(zip(even_keys(len(ids)), ids)))
+        conn.commit()
+    invalidate_todos(user_id)
+    return len(ids)
+
+
+def rank_unranked_todos():
+    """Queues a rebalance for every user with unranked todos (older databases)."""
+    from models import Todo
+
+    def unranked_users():
+        return [row.user_id for row in
+                Todo.query.with_entities(Todo.user_id).filter(Todo.rank.is_(None)).distinct()]
+
+    for user_ids in fan_out(unranked_users):
+        for user_id in user_ids:
+            schedule_rebalance(user_id)  # Already queued ones are skipped
+
+
+def _rebalance_job(payload, report):
+    report(todos=rebalance_ranks(payload['user_id']))
+
+
+register_job('rebalance_ranks', _rebalance_job, concurrency=2)
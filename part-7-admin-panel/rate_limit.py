@@ -0,0 +1,112 @@
+# =============================================================================
+# Part 7: Rate Limiting (token buckets)
+# =============================================================================
+# Without limits, one client can hammer /api/login (slow on purpose - password
+# hashing) or /api/admin/todos (dumps the whole table) as fast as it likes.
+#
+# Token bucket, in one sentence: every client has a bucket holding up to
+# CAPACITY tokens, it refills at RATE tokens per second, and each request
+# takes one token. Empty bucket = 429 Too Many Requests.
+#
+# Buckets are stored in a small local SQLite file (instance/ratelimit.db),
+# so every worker process on this machine shares the same counts. One
+# check is a single INSERT ... ON CONFLICT DO UPDATE ... RETURNING statement.
+#
+# If the bucket file is locked for too long (another process is stuck in a
+# write), the request is let through: a limiter must never take the app down.
+
+import math
+import random
+import sqlite3
+import time
+
+from flask import request, jsonify, current_app
+
+from auth import decode_token
+from local_store import LocalStore
+
+# endpoint -> {scope: (capacity, refill tokens per second)}
+# scope 'ip' = per client address, 'user' = per logged-in user
+LIMITS = {
+    'login': {'ip': (10, 10 / 60)},              # 10 attempts/minute
+    'register': {'ip': (5, 5 / 60)},             # 5 signups/minute
+    'get_all_todos': {'user': (5, 1 / 10)},      # Full table dump: 1 per 10s
+    'get_all_users': {'user': (10, 1 / 2)},
+}
+DEFAULT_LIMITS = {'ip': (100, 20)}               # Everything else: 20/s, bursts of 100
+
+_store = LocalStore('ratelimit.db', durable=False)  # Losing counts in a crash is fine
+
+
+def init_rate_limiter(app):
+    """Creates the bucket store and checks every request before it runs."""
+    _store.open(app, """
+        CREATE TABLE IF NOT EXISTS buckets (
+            key TEXT PRIMARY KEY, tokens REAL NOT NULL,
+            updated REAL NOT NULL, allowed INTEGER NOT NULL);
+    """)
+    app.before_request(check_rate_limit)
+
+
+def take_token(key, capacity, rate):
+    """
+    Takes one token from the bucket called key.
+    Returns (allowed, seconds_until_next_token).
+    """
+    now = time.time()
+    # refill = tokens + time passed * rate, but never more than capacity
+    refill = 'MIN(:capacity, tokens + (:now - updated) * :rate)'
+    row = _store.connection().execute(
+        'INSERT INTO buckets (key, tokens, updated, allowed) '
+        'VALUES (:key, :capacity - 1, :now, 1) '
+        'ON CONFLICT (key) DO UPDATE SET '
+        f'  allowed = {refill} >= 1, '
+        f'  tokens = CASE WHEN {refill} >= 1 THEN {refill} - 1 ELSE {refill} END, '
+        '  updated = :now '
+        'RETURNING allowed, tokens',
+        {'key': key, 'capacity': capacity, 'rate': rate, 'now': now}
+    ).fetchone()
+
+    allowed, tokens = row
+    if allowed:
+        return True, 0
+    return False, math.ceil((1 - tokens) / rate)
+
+
+def _forget_idle_buckets():
+    """Buckets untouched for an hour are full again, so we can drop them."""
+    _store.connection().execute('DELETE FROM buckets WHERE updated < ?', (time.time() - 3600,))
+
+
+def _current_user_id():
+    """Reads the user id from the token WITHOUT a database query."""
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        return decode_token(auth_header.split(' ')[1])
+    return None
+
+
+def check_rate_limit():
+    """before_request hook: returns 429 if any bucket for this request is empty."""
+    limits = LIMITS.get(request.endpoint, DEFAULT_LIMITS)
+
+    for scope, (capacity, rate) in limits.items():
+        who = request.remote_addr if scope == 'ip' else _current_user_id()
+        if who is None:
+            continue
+        try:
+            allowed, retry_after = take_token(f'{request.endpoint}:{scope}:{who}', capacity, rate)
+        except sqlite3.OperationalError as e:  # "database is locked": fail open
+            current_app.logger.warning('Rate limiter unavailable, allowing request: %s', e)
+            return None
+        if not allowed:
+            response = jsonify({'error': 'Too many requests, please slow down'})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(retry_after)
+            return response
+
+    if random.random() < 0.001:
+        try:
+            _forget_idle_buckets()
+        except sqlite3.OperationalError:
+            pass  # Next time
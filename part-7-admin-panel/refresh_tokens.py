@@ -0,0 +1,109 @@
+# =============================================================================
+# Part 7: Refresh Tokens
+# =============================================================================
+# Access tokens (JWT) now expire after ACCESS_TOKEN_MINUTES. Logging in again
+# would run the slow password check every time, so login also returns a
+# REFRESH token - a long random string that can be swapped for a new pair:
+#
+#   POST /api/token/refresh  {"refresh_token": "..."}
+#   -> {"token": "<new access token>", "refresh_token": "<new refresh token>"}
+#
+# That costs one SHA-256 and one index lookup - no password hashing.
+#
+# Rotation: every refresh token works ONCE. If an old one shows up again,
+# someone copied it (the real client already swapped it), so every token
+# from that login (its "family") is revoked and the user has to sign in.
+
+import hashlib
+import secrets
+import uuid
+from datetime import datetime, timedelta
+
+from flask import jsonify
+
+REFRESH_TOKEN_DAYS = 30
+REUSE_GRACE_SECONDS = 10  # Two tabs refreshing at the same moment is not an attack
+
+
+def _hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _find(token):
+    """The stored record for a refresh token (None for anything that isn't one)."""
+    from models import RefreshToken
+
+    if not isinstance(token, str) or not token:  # e.g. {"refresh_token": 123}
+        return None
+    return RefreshToken.query.filter_by(token_hash=_hash(token)).first()
+
+
+def issue_refresh_token(user_id, family_id=None):
+    """Stores a new refresh token and returns it (the only time it exists in clear)."""
+    from models import db, RefreshToken
+
+    token = secrets.token_urlsafe(32)
+    db.session.add(RefreshToken(
+        token_hash=_hash(token),
+        family_id=family_id or uuid.uuid4().hex,
+        user_id=user_id,
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_DAYS)
+    ))
+    db.session.commit()
+    return token
+
+
+def rotate_refresh_token(token):
+    """
+    Swaps a refresh token for a new one.
+    Returns: (user_id, new_token, None) on success, (None, None, error_response) on failure
+    """
+    from models import db, RefreshToken
+
+    now = datetime.utcnow()
+    record = _find(token)
+    if record is None or record.is_revoked or record.expires_at < now:
+        return None, None, (jsonify({'error': 'Refresh token is invalid or expired'}), 401)
+
+    # Mark it used. The WHERE used_at IS NULL makes sure only one request wins.
+    claimed = RefreshToken.query.filter_by(id=record.id, used_at=None).update({'used_at': now})
+    if not claimed:
+        db.session.rollback()
+        if record.used_at and (now - record.used_at).total_seconds() < REUSE_GRACE_SECONDS:
+            return None, None, (jsonify({'error': 'Refresh token was just used'}), 401)
+        # An old token came back: assume it was stolen and end the whole login
+        revoke_family(record.family_id)
+        return None, None, (jsonify({'error': 'Refresh token was already used, please log in again'}), 401)
+
+    return record.user_id, issue_refresh_token(record.user_id, record.family_id), None
+
+
+def revoke_family(family_id):
+    from models import db, RefreshToken
+
+    RefreshToken.query.filter_by(family_id=family_id).update({'is_revoked': True})
+    db.session.commit()
+
+
+def revoke_refresh_token(token):
+    """Logout: ends the login this refresh token belongs to."""
+    record = _find(token)
+    if record:
+        revoke_family(record.family_id)
+
+
+def revoke_user_tokens(user_id):
+    """Ends every login of a user (e.g. when an admin deletes them)."""
+    from models import db, RefreshToken
+
+    RefreshToken.query.filter_by(user_id=user_id).update({'is_revoked': True})
+    db.session.commit()
+
+
+def delete_expired_refresh_tokens():
+    """Called by the nightly maintenance job. Returns the number deleted."""
+    from models import db, RefreshToken
+
+    deleted = RefreshToken.query.filter(RefreshToken.expires_at < datetime.utcnow()).delete()
+    db.session.commit()
+    return deleted
@@ -0,0 +1,165 @@
+# =============================================================================
+# Part 7: Due Dates and Reminders
+# =============================================================================
+# Todos can have a due_at. When it arrives, a reminder event goes out once.
+#
+# Checking "which todos are due?" by scanning the todos table every minute
+# would cost more and more as the table grows. Instead a background thread
+# keeps only the todos due in the next HORIZON_MINUTES in a HEAP (a list
+# where the earliest item is always first), and sleeps until that one:
+#
+#   - every REFILL_SECONDS it reads the todos due within the horizon from
+#     the partial index ix_todos_reminders (open todos not reminded yet),
+#     so the cost depends on how many todos are due, not on the table size
+#   - creating or editing a todo in this process pushes it straight in
+#   - when an item is due, an UPDATE ... WHERE reminded_at IS NULL claims
+#     it, so with several app processes only one of them sends the reminder
+#
+# Other code can listen with on_reminder(func); func(reminder) gets a dict.
+
+import heapq
+import itertools
+import threading
+from datetime import datetime, timedelta, timezone
+
+from metrics import inc
+from sharding import all_shard_keys, shard_for
+
+HORIZON_MINUTES = 10   # How far ahead the heap looks
+REFILL_SECONDS = 60    # How often the heap is refilled from the database
+MISSED_HOURS = 24      # Overdue todos older than this get no reminder
+REFILL_BATCH = 1000    # Max todos read per shard per refill
+
+_heap = []             # (due_at, tie-breaker, shard key, todo id)
+_queued = set()        # (shard key, todo id, due_at) already in the heap
+_counter = itertools.count()
+_lock = threading.Lock()
+_wake_up = threading.Event()
+_listeners = []
+
+
+def parse_due_at(value):
+    """
+    Reads an ISO 8601 date/time ("2024-05-01T17:00:00Z"). Naive times are UTC.
+    Returns: (datetime or None, None) on success, (None, error_response) on failure
+    """
+    from flask import jsonify
+
+    if value is None or value == '':
+        return None, None
+    try:
+        due_at = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None, (jsonify({'error': 'due_at must be an ISO 8601 date/time'}), 400)
+    if due_at.tzinfo:
+        due_at = due_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return due_at, None
+
+
+def _sql_time(value):
+    """The text format SQLAlchemy stores DateTime columns in (needed for =)."""
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def on_reminder(func):
+    """Registers func(reminder) to be called for every reminder sent."""
+    _listeners.append(func)
+
+
+def schedule_reminder(todo):
+    """Call after committing a new/changed due_at: keeps the heap up to date."""
+    if todo.due_at and not todo.is_completed:
+        _push(shard_for(todo.user_id), todo.id, todo.due_at)
+
+
+def _push(key, todo_id, due_at):
+    if due_at > datetime.utcnow() + timedelta(minutes=HORIZON_MINUTES):
+        return  # A later refill will pick it up
+    with _lock:
+        if (key, todo_id, due_at) in _queued:
+            return
+        _queued.add((key, todo_id, due_at))
+        heapq.heappush(_heap, (due_at, next(_counter), key, todo_id))
+    _wake_up.set()  # It may be due before whatever the thread sleeps for
+
+
+def start_reminder_scheduler(app):
+    thread = threading.Thread(target=_run, args=(app,), daemon=True)
+    thread.start()
+
+
+# =============================================================================
+# THE SCHEDULER THREAD
+# =============================================================================
+
+def _refill(db):
+    """Loads the todos due within the horizon (index range scan per shard)."""
+    from models import OPEN_DUE_TODOS_SQL
+
+    now = datetime.utcnow()
+    oldest = _sql_time(now - timedelta(hours=MISSED_HOURS))
+    horizon = _sql_time(now + timedelta(minutes=HORIZON_MINUTES))
+    for key in all_shard_keys():
+        with db.engines[key].connect() as conn:
+            rows = conn.exec_driver_sql(
+                f'SELECT id, due_at FROM todos WHERE {OPEN_DUE_TODOS_SQL} AND reminded_at IS NULL '
+                '  AND due_at >= ? AND due_at <= ? ORDER BY due_at LIMIT ?',
+                (oldest, horizon, REFILL_BATCH)
+            ).fetchall()
+        for todo_id, due_at in rows:
+            _push(key, todo_id, datetime.fromisoformat(due_at))
+
+
+def _send(db, key, todo_id, due_at):
+    """Claims the reminder (one process wins) and tells the listeners."""
+    from models import OPEN_DUE_TODOS_SQL
+
+    with db.engines[key].begin() as conn:
+        row = conn.exec_driver_sql(
+            'UPDATE todos SET reminded_at = ? '
+            f'WHERE id = ? AND due_at = ? AND {OPEN_DUE_TODOS_SQL} AND reminded_at IS NULL '
+            'RETURNING user_id, task_content',
+            (_sql_time(datetime.utcnow()), todo_id, _sql_time(due_at))
+        ).fetchall()
+    if not row:
+        return  # Completed, deleted, moved, or another process sent it
+
+    user_id, task_content = row[0]
+    reminder = {'todo_id': todo_id, 'user_id': user_id, 'task_content': task_content,
+                'due_at': due_at.isoformat()}
+    inc('todo_reminders_total')
+    for listener in _listeners:
+        listener(reminder)
+
+
+def _run(app):
+    from models import db
+
+    next_refill = datetime.min
+    while True:
+        now = datetime.utcnow()
+        with app.app_context():
+            if now >= next_refill:
+                try:
+                    _refill(db)
+                except Exception:
+                    app.logger.exception('Reading due todos failed')
+                next_refill = now + timedelta(seconds=REFILL_SECONDS)
+
+            # Send everything that is due
+            while True:
+                with _lock:
+                    if not _heap or _heap[0][0] > datetime.utcnow():
+                        break
+                    due_at, _, key, todo_id = heapq.heappop(_heap)
+                    _queued.discard((key, todo_id, due_at))
+                try:
+                    _send(db, key, todo_id, due_at)
+                except Exception:
+                    app.logger.exception('Reminder for todo %s failed', todo_id)
+
+        # Sleep until the next item is due or the next refill, whichever is first
+        with _lock:
+            wake_at = min(_heap[0][0], next_refill) if _heap else next_refill
+        _wake_up.wait(max((wake_at - datetime.utcnow()).total_seconds(), 0.01))
+        _wake_up.clear()
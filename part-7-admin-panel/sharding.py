@@ -0,0 +1,203 @@
+# =============================================================================
+# Part 7: Sharding (spread users across several SQLite files)
+# =============================================================================
+# SQLite allows only ONE writer per database file. To get more write capacity
+# we split the data into N "shards" (N separate .db files):
+#
+#   todo_part7.db          <- shard 0 (the default database)
+#   todo_part7_shard1.db   <- shard 1
+#   todo_part7_shard2.db   <- shard 2 ...
+#
+# A user and ALL of their todos live in the same shard, picked by a stable
+# hash of the user id. A small "directory" database maps email/username to
+# user id, so /api/login and /api/register know which shard to use.
+#
+# Set the number of shards with the TODO_SHARDS environment variable
+# (default 1 = everything in todo_part7.db, just like before).
+#
+# Todo ids are unique across shards too: they come from a counter in the
+# directory, a block of TODO_ID_BLOCK ids at a time per process.
+
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g, current_app
+from flask_sqlalchemy.session import Session
+
+SHARD_COUNT = int(os.environ.get('TODO_SHARDS', '1'))
+DIRECTORY_BIND = 'directory'
+TODO_ID_BLOCK = 1000  # Todo ids a process takes from the directory at once
+
+_todo_ids = {'pid': None, 'next': 0, 'end': 0}  # This process's current block
+_todo_ids_lock = threading.Lock()
+
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+def configure_shards(app):
+    """Adds one SQLALCHEMY_BINDS entry per extra shard plus the directory."""
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    binds[DIRECTORY_BIND] = 'sqlite:///todo_part7_directory.db'
+    for number in range(1, SHARD_COUNT):
+        binds[shard_key(number)] = f'sqlite:///todo_part7_shard{number}.db'
+
+
+def shard_key(number):
+    """Shard 0 is the default database (bind key None)."""
+    return None if number == 0 else f'shard{number}'
+
+
+def all_shard_keys():
+    return [shard_key(number) for number in range(SHARD_COUNT)]
+
+
+def shard_for(user_id):
+    """Stable hash: the same user id always maps to the same shard."""
+    return shard_key(zlib.crc32(str(user_id).encode()) % SHARD_COUNT)
+
+
+def create_shard_tables(db):
+    """Creates the directory table and the users/todos tables on every shard."""
+    from models import upgrade_schema
+
+    for engine in db.engines.values():
+        # WAL: readers (and online backups) never block writers. It is stored
+        # in the file, so this only changes something the first time.
+        with engine.connect() as conn:
+            conn.exec_driver_sql('PRAGMA journal_mode = WAL')
+    db.create_all(bind_key=[None, DIRECTORY_BIND])
+    upgrade_schema(db.engines[DIRECTORY_BIND], db.metadatas[DIRECTORY_BIND])
+    for key in all_shard_keys():
+        # users/todos have no bind key, so create them on each extra shard too
+        db.metadata.create_all(db.engines[key])
+        upgrade_schema(db.engines[key])
+    sync_todo_id_counter(db)
+
+
+# =============================================================================
+# ROUTING: pick the shard for the current request
+# =============================================================================
+
+class ShardedSession(Session):
+    """
+    db.session that sends users/todos queries to the current request's shard.
+    Call use_shard(user_id) before the first query that touches user data.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        engines = self._db.engines
+        key = g.get('shard')
+        if key is not None and engine is engines.get(None):
+            return engines[key]
+        return engine
+
+
+def use_shard(user_id):
+    """Routes the rest of this request's user/todo queries to the user's shard."""
+    g.shard = shard_for(user_id)
+    return g.shard
+
+
+# =============================================================================
+# FAN-OUT: run the same query on every shard (admin endpoints)
+# =============================================================================
+
+def fan_out(func):
+    """
+    Calls func() once per shard, in parallel threads, and returns the list of
+    results. Each thread gets its own app context, so its own db.session.
+    """
+    from models import db
+
+    app = current_app._get_current_object()
+
+    def run_on_shard(key):
+        with app.app_context():
+            g.shard = key
+            try:
+                return func()
+            finally:
+                db.session.remove()
+
+    if SHARD_COUNT == 1:
+        return [func()]
+
+    with ThreadPoolExecutor(max_workers=SHARD_COUNT) as pool:
+        return list(pool.map(run_on_shard, all_shard_keys()))
+
+
+# =============================================================================
+# DIRECTORY: email/username -> user id (and therefore shard)
+# =============================================================================
+
+def register_in_directory(username, email):
+    """
+    Reserves the email and username in the directory and returns the new
+    global user id. Raises IntegrityError if either one is already taken.
+    """
+    from models import db, UserDirectory
+
+    entry = UserDirectory(username=username, email=email)
+    db.session.add(entry)
+    db.session.commit()
+    return entry.id
+
+
+def sync_todo_id_counter(db):
+    """
+    Makes sure the directory's todo id counter is above every todo id in use
+    (new databases, and databases from before todo ids were global).
+    """
+    highest = 0
+    for key in all_shard_keys():
+        with db.engines[key].connect() as conn:
+            highest = max(highest, conn.exec_driver_sql(
+                'SELECT MAX(COALESCE((SELECT MAX(id) FROM todos), 0),'
+                '           COALESCE((SELECT MAX(todo_id) FROM todos_archive), 0))').scalar())
+    with db.engines[DIRECTORY_BIND].begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO id_sequences (name, next_id) VALUES ('todos', ?) "
+            'ON CONFLICT (name) DO UPDATE SET next_id = MAX(next_id, excluded.next_id)',
+            (highest + 1,))
+
+
+def next_todo_id():
+    """
+    A new todo id that no shard uses (Todo.id's default). Usually just a
+    counter in memory; every TODO_ID_BLOCK ids one short directory write.
+    """
+    from models import db
+
+    with _todo_ids_lock:
+        # A new block after it runs out - and after a fork, so two worker
+        # processes never hand out the same block
+        if _todo_ids['pid'] != os.getpid() or _todo_ids['next'] >= _todo_ids['end']:
+            with db.engines[DIRECTORY_BIND].begin() as conn:
+                end = conn.exec_driver_sql(
+                    "UPDATE id_sequences SET next_id = next_id + ? WHERE name = 'todos' "
+                    'RETURNING next_id', (TODO_ID_BLOCK,)).scalar_one()
+            _todo_ids.update(pid=os.getpid(), next=end - TODO_ID_BLOCK, end=end)
+        todo_id = _todo_ids['next']
+        _todo_ids['next'] += 1
+        return todo_id
+
+
+def backfill_directory():
+    """Adds directory entries for users created before sharding was enabled."""
+    from models import db, User, UserDirectory
+
+    if UserDirectory.query.first():
+        return
+
+    def list_users():
+        return [(u.id, u.username, u.email) for u in User.query.all()]
+
+    for users in fan_out(list_users):
+        for user_id, username, email in users:
+            db.session.add(UserDirectory(id=user_id, username=username, email=email))
+    db.session.commit()
@@ -0,0 +1,213 @@
+# =============================================================================
+# Part 7: Shared Lists (and who may change which todo)
+# =============================================================================
+# A user can create a list and share it with other users:
+#
+#   POST /api/lists                       {"name": "Groceries"}
+#   POST /api/lists/1/members             {"email": "bob@example.com", "role": "editor"}
+#   POST /api/todos                       {"task_content": "Milk", "list_id": 1}
+#   GET  /api/lists/1/todos               the list's todos
+#   GET  /api/lists/todos                 todos of ALL my lists, with can_edit
+#   PUT  /api/todos/5?list_id=1           edit a todo on a shared list
+#
+# Roles: owner (manages members), editor (adds/changes todos), viewer (reads).
+#
+# A shared list's todos are stored with the OWNER's todos (on the owner's
+# shard, user_id = owner). Lists and memberships are in the directory
+# database, so members on any shard can find them.
+#
+# Routes used to check `todo.user_id != current_user.id`. Now they ask
+# check_todo_access(user, todo). It loads ALL of the user's memberships with
+# ONE query on ix_list_members_user and keeps them in `g` for the rest of the
+# request - a page with todos from 20 lists still costs one query.
+
+from flask import jsonify, g
+
+from sharding import use_shard, shard_for
+
+ROLES = ('owner', 'editor', 'viewer')
+WRITE_ROLES = ('owner', 'editor')
+MAX_LIST_NAME_LENGTH = 100  # Same as TodoList.name = db.String(100)
+
+
+# =============================================================================
+# ACCESS CHECKS (one membership query per request)
+# =============================================================================
+
+def get_list_roles(user):
+    """{list_id: {'role', 'owner_id', 'name'}} for every list the user is on (cached per request)."""
+    from models import db, TodoList, ListMember
+
+    cached = g.get('list_roles')
+    if cached is not None and cached[0] == user.id:
+        return cached[1]
+
+    rows = db.session.query(ListMember.list_id, ListMember.role, TodoList.owner_id, TodoList.name) \
+        .join(TodoList, TodoList.id == ListMember.list_id) \
+        .filter(ListMember.user_id == user.id).all()
+    roles = {list_id: {'role': role, 'owner_id': owner_id, 'name': name}
+             for list_id, role, owner_id, name in rows}
+    g.list_roles = (user.id, roles)
+    return roles
+
+
+def list_role(user, list_id):
+    """The user's role on a list, or None."""
+    membership = get_list_roles(user).get(list_id)
+    return membership['role'] if membership else None
+
+
+def can_write(user, todo):
+    if todo.list_id is None:
+        return todo.user_id == user.id
+    return list_role(user, todo.list_id) in WRITE_ROLES
+
+
+def can_read(user, todo):
+    if todo.list_id is None:
+        return todo.user_id == user.id
+    return list_role(user, todo.list_id) is not None
+
+
+def check_todo_access(user, todo, write=True):
+    """Returns an error response, or None if the user may read/change the todo."""
+    allowed = can_write(user, todo) if write else can_read(user, todo)
+    if not allowed:
+        return jsonify({'error': 'Not authorized'}), 403
+    return None
+
+
+def use_list_shard(user, list_id, write=False):
+    """
+    For a todo on a shared list (?list_id= / "list_id"): checks the user is
+    on the list and routes the next queries to the owner's shard.
+    Returns: (owner_id or None, None) on success, (None, error_response) on failure
+    """
+    if list_id is None:
+        return None, None
+    role = list_role(user, list_id)
+    if role is None:
+        return None, (jsonify({'error': 'List not found'}), 404)
+    if write and role not in WRITE_ROLES:
+        return None, (jsonify({'error': 'Not authorized'}), 403)
+
+    owner_id = get_list_roles(user)[list_id]['owner_id']
+    use_shard(owner_id)
+    return owner_id, None
+
+
+# =============================================================================
+# LISTS AND MEMBERS
+# =============================================================================
+
+def create_list(user, name):
+    """Returns: (todo_list, None) on success, (None, error_response) on failure"""
+    from models import db, TodoList, ListMember
+
+    name = (name or '').strip()
+    if not name or len(name) > MAX_LIST_NAME_LENGTH:
+        return None, (jsonify({'error': f'name must be 1 to {MAX_LIST_NAME_LENGTH} characters'}), 400)
+
+    todo_list = TodoList(name=name, owner_id=user.id)
+    db.session.add(todo_list)
+    db.session.flush()  # Get the id
+    db.session.add(ListMember(list_id=todo_list.id, user_id=user.id, role='owner'))
+    db.session.commit()
+    g.pop('list_roles', None)
+    return todo_list, None
+
+
+def get_user_lists(user):
+    return [dict(id=list_id, **membership) for list_id, membership in get_list_roles(user).items()]
+
+
+def get_members(list_id):
+    from models import ListMember, UserDirectory
+
+    rows = ListMember.query.with_entities(ListMember.user_id, ListMember.role, UserDirectory.username) \
+        .join(UserDirectory, UserDirectory.id == ListMember.user_id) \
+        .filter(ListMember.list_id == list_id).all()
+    return [{'user_id': user_id, 'username': username, 'role': role} for user_id, role, username in rows]
+
+
+def add_member(list_id, email, role):
+    """Adds or changes a member. Returns: (member, None) or (None, error_response)"""
+    from models import db, ListMember, UserDirectory
+
+    if role not in ('editor', 'viewer'):
+        return None, (jsonify({'error': 'role must be editor or viewer'}), 400)
+    entry = UserDirectory.query.filter(db.func.lower(UserDirectory.email) == (email or '').lower()).first()
+    if entry is None:
+        return None, (jsonify({'error': 'User not found'}), 404)
+
+    member = ListMember.query.get((list_id, entry.id))
+    if member is not None and member.role == 'owner':
+        return None, (jsonify({'error': 'The owner is always a member'}), 400)
+    if member is None:
+        member = ListMember(list_id=list_id, user_id=entry.id)
+        db.session.add(member)
+    member.role = role
+    db.session.commit()
+    return {'user_id': entry.id, 'username': entry.username, 'role': role}, None
+
+
+def remove_member(list_id, user_id):
+    """Returns: error_response or None"""
+    from models import db, ListMember
+
+    member = ListMember.query.get((list_id, user_id))
+    if member is None:
+        return jsonify({'error': 'Not a member'}), 404
+    if member.role == 'owner':
+        return jsonify({'error': 'The owner is always a member'}), 400
+    db.session.delete(member)
+    db.session.commit()
+    return None
+
+
+def delete_user_lists(user_id):
+    """For user purges: their memberships, and the lists they own (call before commit)."""
+    from models import TodoList, ListMember
+
+    owned = [row.id for row in TodoList.query.with_entities(TodoList.id).filter_by(owner_id=user_id)]
+    if owned:
+        ListMember.query.filter(ListMember.list_id.in_(owned)).delete(synchronize_session=False)
+        TodoList.query.filter(TodoList.id.in_(owned)).delete(synchronize_session=False)
+    ListMember.query.filter_by(user_id=user_id).delete()
+
+
+# =============================================================================
+# LIST VIEWS
+# =============================================================================
+
+def _order(query):
+    from models import Todo
+
+    return query.order_by(Todo.rank.is_(None), Todo.rank, Todo.id)
+
+
+def list_todos(list_id):
+    """The live todos of one list (call use_list_shard first)."""
+    from models import Todo
+
+    return _order(Todo.query.filter_by(list_id=list_id, deleted_at=None)).all()
+
+
+def shared_todos(user):
+    """Todos of every list the user is on, each with can_edit. One query per owner shard."""
+    from models import Todo
+
+    lists_by_shard = {}  # shard -> (an owner on it, [list ids])
+    for list_id, membership in get_list_roles(user).items():
+        owner_id = membership['owner_id']
+        lists_by_shard.setdefault(shard_for(owner_id), (owner_id, []))[1].append(list_id)
+
+    todos = []
+    for owner_id, list_ids in lists_by_shard.values():
+        use_shard(owner_id)
+        # Todos from before global todo ids can share an id with a todo on
+        # another shard: read fresh rows, not the session's copies
+        query = Todo.query.filter(Todo.list_id.in_(list_ids), Todo.deleted_at.is_(None)) \
+            .execution_options(populate_existing=True)
+        todos += [dict(todo.to_dict(), can_edit=can_write(user, todo)) for todo in _order(query)]
+    return todos
@@ -0,0 +1,119 @@
+# =============================================================================
+# Part 7: Slow Query Log
+# =============================================================================
+# The ORM hides the SQL it runs: Todo.query.filter_by(...), User.query.count(),
+# the lazy load behind user.todos... This module times EVERY statement and,
+# when one takes longer than SLOW_QUERY_MS, records:
+#
+#   - the normalized SQL   (numbers/strings replaced by ?, so similar
+#                           queries are grouped together)
+#   - the parameter shape  e.g. (int, str)
+#   - the route that ran it, and how long it took
+#   - the EXPLAIN QUERY PLAN, captured the first time we see the query
+#     ("SCAN todos" = reads the whole table, "SEARCH ... USING INDEX" = good)
+#
+# Admins get the worst offenders at GET /api/admin/slow-queries.
+
+import logging
+import os
+import re
+import threading
+import time
+
+from flask import request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')  # Not CREATE, VACUUM...
+
+logger = logging.getLogger('slow_queries')
+
+_lock = threading.Lock()
+_slow = {}  # normalized sql -> stats dict
+
+_NUMBER = re.compile(r'\b\d+(\.\d+)?\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_IN_LIST = re.compile(r'\(\s*\?(\s*,\s*\?)+\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_sql(statement):
+    """'WHERE id IN (1, 2, 3) AND name = 'x'' -> 'WHERE id IN (?...) AND name = ?'"""
+    sql = _STRING.sub('?', statement)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(?...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def _parameter_shape(parameters):
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{k}: {type(v).__name__}' for k, v in parameters.items()) + '}'
+    return '(' + ', '.join(type(v).__name__ for v in parameters or ()) + ')'
+
+
+def _explain(conn, statement, parameters):
+    """Runs EXPLAIN QUERY PLAN on the raw connection (no ORM events fire)."""
+    try:
+        cursor = conn.connection.dbapi_connection.cursor()
+        rows = cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+        cursor.close()
+        return [row[-1] for row in rows]  # The last column is the readable detail
+    except Exception as e:
+        return [f'(EXPLAIN failed: {e})']
+
+
+# =============================================================================
+# ENGINE EVENTS (every statement on every engine)
+# =============================================================================
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before(conn, cursor, statement, parameters, context, executemany):
+    # One value, overwritten by the next statement: a statement that raises
+    # (so _after never runs) leaves nothing behind
+    conn.info['slow_query_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('slow_query_started', None)
+    if started is None:
+        return
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if elapsed_ms < SLOW_QUERY_MS:
+        return
+
+    sql = normalize_sql(statement)
+    route = request.endpoint if has_request_context() else 'background'
+
+    with _lock:
+        entry = _slow.get(sql)
+        first_time = entry is None
+        if first_time:
+            entry = _slow[sql] = {
+                'sql': sql,
+                'parameter_shape': _parameter_shape(parameters),
+                'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'routes': {}, 'plan': None,
+            }
+        entry['count'] += 1
+        entry['total_ms'] += elapsed_ms
+        entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+        entry['routes'][route] = entry['routes'].get(route, 0) + 1
+
+    if first_time and not executemany and sql.split(' ', 1)[0].upper() in EXPLAINABLE:
+        entry['plan'] = _explain(conn, statement, parameters)
+
+    logger.warning('Slow query (%.1f ms) in %s: %s', elapsed_ms, route, sql)
+
+
+def slow_query_report(limit=20):
+    """The slowest queries, by total time spent in them."""
+    with _lock:
+        entries = sorted(_slow.values(), key=lambda e: e['total_ms'], reverse=True)
+        return [
+            dict(e, total_ms=round(e['total_ms'], 1), max_ms=round(e['max_ms'], 1),
+                 avg_ms=round(e['total_ms'] / e['count'], 1), routes=dict(e['routes']))
+            for e in entries[:limit]
+        ]
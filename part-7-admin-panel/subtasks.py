@@ -0,0 +1,168 @@
+# =============================================================================
+# Part 7: Subtasks (todos inside todos)
+# =============================================================================
+# A todo can have a parent: POST /api/todos {"task_content": "...", "parent_id": 3}
+# Subtasks can have subtasks too, up to MAX_DEPTH levels.
+#
+#   GET /api/todos/3/tree   -> todo 3 with all its subtasks, nested
+#
+# The whole subtree comes from ONE query: a RECURSIVE common table
+# expression walks down the parent_id index level by level:
+#
+#   WITH RECURSIVE subtree(id, depth) AS (
+#       SELECT 3, 0                                          -- the root
+#       UNION ALL
+#       SELECT todos.id, depth + 1 FROM todos
+#       JOIN subtree ON todos.parent_id = subtree.id         -- its children
+#   )
+#
+# Roll-ups: every todo stores subtask_total / subtask_done for ALL its live
+# subtasks (children, grandchildren, ...), so "3 of 7 done" needs no
+# counting. When a subtask is added, ticked off, trashed or restored, one
+# UPDATE adds the change to each ancestor (again found with a recursive CTE).
+# (SQLite doesn't allow WITH inside triggers, so this isn't a trigger.)
+#
+# Trashing a todo trashes its subtasks too, BATCH_SIZE rows per transaction;
+# restoring it brings back the subtasks that were trashed with it.
+
+from datetime import datetime
+
+from flask import jsonify
+
+MAX_DEPTH = 10     # Levels of subtasks below a top-level todo
+BATCH_SIZE = 500   # Subtasks trashed/restored per transaction
+
+# A todo and its parent, grandparent, ... (walks up the primary key)
+ANCESTORS_SQL = """
+    WITH RECURSIVE ancestors(id, depth) AS (
+        SELECT :parent_id, 0
+        UNION ALL
+        SELECT todos.parent_id, ancestors.depth + 1 FROM todos
+        JOIN ancestors ON todos.id = ancestors.id
+        WHERE todos.parent_id IS NOT NULL AND ancestors.depth < :max_depth
+    )
+"""
+
+ROLL_UP_SQL = ANCESTORS_SQL + """
+    UPDATE todos SET subtask_total = subtask_total + :total, subtask_done = subtask_done + :done
+    WHERE id IN (SELECT id FROM ancestors)
+"""
+
+
+def roll_up(parent_id, total, done):
+    """Adds total/done to the parent and every ancestor above it (call before commit)."""
+    from models import db
+
+    if parent_id is not None and (total or done):
+        db.session.execute(db.text(ROLL_UP_SQL), {
+            'parent_id': parent_id, 'max_depth': MAX_DEPTH, 'total': total, 'done': done})
+
+
+def _counts(todo):
+    """What a todo adds to its ancestors' roll-ups: itself + its live subtasks."""
+    return 1 + todo.subtask_total, int(bool(todo.is_completed)) + todo.subtask_done
+
+
+def _subtree(root_id, live_only):
+    """Recursive CTE with the ids of a todo and all its subtasks."""
+    from models import db, Todo
+
+    tree = db.select(db.literal(root_id).label('id'), db.literal(0).label('depth')) \
+        .cte('subtree', recursive=True)
+    children = db.select(Todo.id, tree.c.depth + 1).where(
+        Todo.parent_id == tree.c.id, tree.c.depth < MAX_DEPTH)
+    if live_only:
+        children = children.where(Todo.deleted_at.is_(None))
+    return tree.union_all(children)
+
+
+# =============================================================================
+# CREATING, COMPLETING, TRASHING
+# =============================================================================
+
+def find_parent(user_id, parent_id):
+    """
+    Checks the parent_id of a new todo.
+    Returns: (parent or None, None) on success, (None, error_response) on failure
+    """
+    from models import db, Todo
+
+    if parent_id is None:
+        return None, None
+    parent = Todo.query.filter_by(id=parent_id, user_id=user_id, deleted_at=None).first()
+    if parent is None:
+        return None, (jsonify({'error': 'Parent todo not found'}), 400)
+
+    levels = db.session.execute(db.text(ANCESTORS_SQL + 'SELECT COUNT(*) FROM ancestors'),
+                                {'parent_id': parent.id, 'max_depth': MAX_DEPTH}).scalar()
+    if levels > MAX_DEPTH:
+        return None, (jsonify({'error': f'Subtasks can be at most {MAX_DEPTH} levels deep'}), 400)
+    return parent, None
+
+
+def _cascade(root_id, old_deleted_at, new_deleted_at):
+    """Sets deleted_at on the subtasks below root, one batch per transaction."""
+    from models import db, Todo
+
+    tree = _subtree(root_id, live_only=False)
+    while True:
+        ids = [row.id for row in Todo.query.with_entities(Todo.id).filter(
+            Todo.id.in_(db.select(tree.c.id)),
+            Todo.id != root_id,
+            Todo.deleted_at == old_deleted_at  # None becomes IS NULL
+        ).limit(BATCH_SIZE)]
+        if not ids:
+            return
+        Todo.query.filter(Todo.id.in_(ids)).update({'deleted_at': new_deleted_at},
+                                                   synchronize_session=False)
+        db.session.commit()
+
+
+def trash_subtree(todo):
+    """Moves a todo and its subtasks to the trash."""
+    from models import db
+
+    total, done = _counts(todo)
+    roll_up(todo.parent_id, -total, -done)
+    deleted_at = todo.deleted_at = datetime.utcnow()
+    db.session.commit()
+    _cascade(todo.id, None, deleted_at)
+
+
+def restore_subtree(todo):
+    """
+    Takes a todo and the subtasks trashed together with it out of the trash.
+    Returns: error_response or None
+    """
+    from models import db, Todo
+
+    if todo.parent_id is not None and \
+            Todo.query.filter_by(id=todo.parent_id, deleted_at=None).first() is None:
+        return jsonify({'error': 'Restore the parent todo first'}), 400
+
+    deleted_at = todo.deleted_at
+    total, done = _counts(todo)
+    roll_up(todo.parent_id, total, done)
+    todo.deleted_at = None
+    db.session.commit()
+    _cascade(todo.id, deleted_at, None)
+    return None
+
+
+# =============================================================================
+# THE TREE
+# =============================================================================
+
+def get_tree(todo):
+    """The todo with its live subtasks nested under 'subtasks' (one query)."""
+    from models import Todo
+
+    tree = _subtree(todo.id, live_only=True)
+    todos = Todo.query.join(tree, Todo.id == tree.c.id) \
+        .order_by(Todo.rank.is_(None), Todo.rank, Todo.id).all()
+
+    nodes = {t.id: dict(t.to_dict(), subtasks=[]) for t in todos}
+    for t in todos:
+        if t.id != todo.id and t.parent_id in nodes:
+            nodes[t.parent_id]['subtasks'].append(nodes[t.id])
+    return nodes[todo.id]
@@ -0,0 +1,167 @@
+# =============================================================================
+# Part 7: Tags (labels on todos) and Filtering by Tag
+# =============================================================================
+# A todo can have several tags ("work", "urgent", ...):
+#
+#   POST /api/todos            {"task_content": "...", "tags": ["work", "urgent"]}
+#   PUT  /api/todos/3          {"tags": ["home"]}          replaces the tags
+#   GET  /api/todos?tags=work,urgent&mode=all              todos with BOTH tags
+#   GET  /api/todos?tags=work,urgent&mode=any              todos with EITHER tag
+#   GET  /api/tags                                         tags + todo counts
+#
+# Tags live in `tags`; `todo_tags` links todos to tags. Filtering is done with
+# set operations in SQL, one index range per tag:
+#
+#   mode=all:  SELECT todo_id FROM todo_tags WHERE tag_id = 1
+#              INTERSECT
+#              SELECT todo_id FROM todo_tags WHERE tag_id = 2
+#   mode=any:  ... UNION ...
+#
+# The sidebar shows how many todos each tag has. Counting with GROUP BY on
+# every page load would read all of the user's todo_tags rows, so tags carry
+# a todo_count that SQLite TRIGGERS keep up to date (live todos only - todos
+# in the trash don't count).
+
+from flask import jsonify
+from sqlalchemy.dialects.sqlite import insert
+
+from sharding import all_shard_keys
+
+MAX_TAGS_PER_TODO = 10
+MAX_TAG_LENGTH = 30   # Same as Tag.name = db.String(30)
+MAX_FILTER_TAGS = 10
+
+TAG_COUNT_TRIGGERS = [
+    # A tag added to / removed from a live todo
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_tags_count_insert AFTER INSERT ON todo_tags
+    WHEN EXISTS (SELECT 1 FROM todos WHERE id = NEW.todo_id AND deleted_at IS NULL)
+    BEGIN
+        UPDATE tags SET todo_count = todo_count + 1 WHERE id = NEW.tag_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_tags_count_delete AFTER DELETE ON todo_tags
+    WHEN EXISTS (SELECT 1 FROM todos WHERE id = OLD.todo_id AND deleted_at IS NULL)
+    BEGIN
+        UPDATE tags SET todo_count = todo_count - 1 WHERE id = OLD.tag_id;
+    END
+    """,
+    # A todo moved to / taken out of the trash
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_tag_count_trash AFTER UPDATE OF deleted_at ON todos
+    WHEN (OLD.deleted_at IS NULL) != (NEW.deleted_at IS NULL)
+    BEGIN
+        UPDATE tags SET todo_count = todo_count + (CASE WHEN NEW.deleted_at IS NULL THEN 1 ELSE -1 END)
+        WHERE id IN (SELECT tag_id FROM todo_tags WHERE todo_id = NEW.id);
+    END
+    """,
+    # A todo deleted for good (trash cleanup, archive, purge): drop its links
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_tag_links_delete AFTER DELETE ON todos
+    BEGIN
+        UPDATE tags SET todo_count = todo_count - 1
+        WHERE OLD.deleted_at IS NULL AND id IN (SELECT tag_id FROM todo_tags WHERE todo_id = OLD.id);
+        DELETE FROM todo_tags WHERE todo_id = OLD.id;
+    END
+    """,
+]
+
+
+def install_tag_counters(db):
+    """Creates the tag count triggers on every shard."""
+    for key in all_shard_keys():
+        with db.engines[key].begin() as conn:
+            for trigger in TAG_COUNT_TRIGGERS:
+                conn.exec_driver_sql(trigger)
+
+
+# =============================================================================
+# READING TAGS FROM REQUESTS
+# =============================================================================
+
+def _clean(names):
+    """Lowercase, trimmed, no duplicates, in the order given."""
+    cleaned = []
+    for name in names:
+        name = str(name).strip().lower()
+        if name and name not in cleaned:
+            cleaned.append(name)
+    return cleaned
+
+
+def parse_tags(value):
+    """
+    Reads the "tags" list of a create/update request.
+    Returns: (names, None) on success, (None, error_response) on failure
+    """
+    if value is None:
+        return [], None
+    if not isinstance(value, list):
+        return None, (jsonify({'error': 'tags must be a list of names'}), 400)
+
+    names = _clean(value)
+    if len(names) > MAX_TAGS_PER_TODO:
+        return None, (jsonify({'error': f'At most {MAX_TAGS_PER_TODO} tags per todo'}), 400)
+    if any(len(name) > MAX_TAG_LENGTH or ',' in name for name in names):
+        return None, (jsonify({'error': f'Tags are at most {MAX_TAG_LENGTH} characters, without commas'}), 400)
+    return names, None
+
+
+def parse_tag_filter(args):
+    """
+    Reads ?tags=a,b&mode=all|any.
+    Returns: ((names, mode), None) on success, (None, error_response) on failure
+    """
+    names = _clean(args.get('tags', '').split(','))
+    mode = args.get('mode', 'all')
+    if mode not in ('all', 'any'):
+        return None, (jsonify({'error': 'mode must be all or any'}), 400)
+    if not names or len(names) > MAX_FILTER_TAGS:
+        return None, (jsonify({'error': f'tags must list 1 to {MAX_FILTER_TAGS} names'}), 400)
+    return (names, mode), None
+
+
+# =============================================================================
+# WRITING AND QUERYING
+# =============================================================================
+
+def set_todo_tags(todo, names):
+    """Replaces the todo's tags, creating the user's new tags (call before commit)."""
+    from models import db, Tag
+
+    if names:
+        # INSERT OR IGNORE: two requests creating the same tag can't clash
+        db.session.execute(insert(Tag).on_conflict_do_nothing(),
+                           [{'user_id': todo.user_id, 'name': name} for name in names])
+        todo.tags = Tag.query.filter(Tag.user_id == todo.user_id, Tag.name.in_(names)).all()
+    else:
+        todo.tags = []
+
+
+def filter_by_tags(query, user_id, names, mode):
+    """Adds "has all/any of these tags" to a Todo query."""
+    from models import db, Todo, Tag, TodoTag
+
+    tag_ids = [tag_id for (tag_id,) in db.session.query(Tag.id)
+               .filter(Tag.user_id == user_id, Tag.name.in_(names))]
+    if mode == 'all' and len(tag_ids) < len(names):
+        return query.filter(db.false())  # A tag nobody has: no todo has all of them
+    if not tag_ids:
+        return query.filter(db.false())
+
+    selects = [db.select(TodoTag.todo_id).where(TodoTag.tag_id == tag_id) for tag_id in tag_ids]
+    if len(selects) == 1:
+        matching = selects[0]
+    elif mode == 'all':
+        matching = db.intersect(*selects)
+    else:
+        matching = db.union(*selects)
+    return query.filter(Todo.id.in_(matching))
+
+
+def get_user_tags(user_id):
+    """The user's tags with their counts, by name (ix_tags_user_name, no GROUP BY)."""
+    from models import Tag
+
+    return Tag.query.filter(Tag.user_id == user_id, Tag.todo_count > 0).order_by(Tag.name).all()
@@ -0,0 +1,107 @@
+# =============================================================================
+# Part 7: Todo List Cache
+# =============================================================================
+# GET /api/todos is the busiest route, and most of the time the list hasn't
+# changed since the last call. So we keep the finished JSON bytes per user
+# and send them again, instead of loading and serializing every todo.
+#
+# Memory: entries are kept in LRU order. When they take up more than
+# TODO_CACHE_BYTES, the least recently used lists are dropped.
+#
+# Staying correct: every user has a GENERATION number in a small local
+# SQLite file (instance/todo_cache.db), shared by every worker process on
+# this machine. Each cached list remembers the generation it was built at.
+# Any change to a user's todos bumps their generation (after the commit), so
+# the old list no longer matches in ANY process and gets rebuilt.
+# Generation 0 (ALL_USERS) is bumped by jobs that touch many users at once.
+
+import os
+import threading
+from collections import OrderedDict
+
+from flask import current_app, jsonify
+
+from local_store import LocalStore
+from metrics import cache_lookup
+
+TODO_CACHE_BYTES = int(os.environ.get('TODO_CACHE_BYTES', 16 * 1024 * 1024))
+ALL_USERS = 0
+
+_entries = OrderedDict()   # user_id -> (generation, JSON bytes), oldest first
+_size = 0                  # Bytes held in _entries
+_lock = threading.Lock()
+_generations = LocalStore('todo_cache.db', durable=False)  # Caches don't survive a crash anyway
+
+
+def init_todo_cache(app):
+    """Creates the shared generation store."""
+    _generations.open(app, """
+        CREATE TABLE IF NOT EXISTS generations (
+            user_id INTEGER PRIMARY KEY, gen INTEGER NOT NULL);
+    """)
+
+
+def _generation(user_id):
+    # Both numbers only ever go up, so their sum changes whenever either does
+    return _generations.connection().execute(
+        'SELECT COALESCE(SUM(gen), 0) FROM generations WHERE user_id IN (?, ?)',
+        (user_id, ALL_USERS)
+    ).fetchone()[0]
+
+
+def invalidate_todos(user_id=ALL_USERS):
+    """Call AFTER committing a change to user_id's todos (every process sees it)."""
+    _generations.connection().execute(
+        'INSERT INTO generations (user_id, gen) VALUES (?, 1) '
+        'ON CONFLICT (user_id) DO UPDATE SET gen = gen + 1',
+        (user_id,)
+    )
+    _forget(user_id)
+
+
+def _forget(user_id):
+    global _size
+    with _lock:
+        if user_id == ALL_USERS:
+            _entries.clear()
+            _size = 0
+        elif user_id in _entries:
+            _size -= len(_entries.pop(user_id)[1])
+
+
+def _store(user_id, generation, body):
+    global _size
+    if len(body) > TODO_CACHE_BYTES:
+        return  # Would push everything else out
+    with _lock:
+        if user_id in _entries:
+            _size -= len(_entries.pop(user_id)[1])
+        _entries[user_id] = (generation, body)
+        _size += len(body)
+        while _size > TODO_CACHE_BYTES:
+            _, (_, evicted) = _entries.popitem(last=False)  # Least recently used
+            _size -= len(evicted)
+
+
+def cached_todos_response(user_id, build):
+    """
+    Returns the user's todo list as a JSON response, from the cache if it is
+    still current. build() is only called on a miss and returns the dict.
+    """
+    # Read the generation BEFORE building, so a change made while we build
+    # leaves the new entry already out of date instead of wrongly current
+    generation = _generation(user_id)
+
+    body = None
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry and entry[0] == generation:
+            _entries.move_to_end(user_id)
+            body = entry[1]
+    cache_lookup('todos', hit=body is not None)
+
+    if body is None:
+        body = jsonify(build()).get_data()
+        _store(user_id, generation, body)
+
+    return current_app.response_class(body, mimetype='application/json')
@@ -0,0 +1,115 @@
+# =============================================================================
+# Part 7: Bulk Import of Todos (CSV or NDJSON)
+# =============================================================================
+# Moving 5,000 todos from another app would take 5,000 POST /api/todos calls.
+# POST /api/todos/import takes them all in one upload instead:
+#
+#   CSV (Content-Type: text/csv)           NDJSON (application/x-ndjson)
+#   task_content,is_completed              {"task_content": "Buy milk"}
+#   Buy milk,false                         {"task_content": "Call mom", "is_completed": true}
+#   Call mom,true
+#
+# The upload is read line by line (never all in memory), each row is checked
+# against the Todo model's rules, and valid rows are inserted BATCH_SIZE at a
+# time - one executemany INSERT and one short transaction per batch.
+
+import csv
+import io
+import json
+
+from sqlalchemy import insert
+
+BATCH_SIZE = 1000        # Rows per INSERT / transaction
+MAX_REPORTED_ERRORS = 100
+MAX_TASK_LENGTH = 200    # Same as Todo.task_content = db.String(200)
+
+TRUE_VALUES = ('true', '1', 'yes', 'y')
+FALSE_VALUES = ('false', '0', 'no', 'n', '')
+
+
+def _csv_rows(text_stream):
+    for row in csv.DictReader(text_stream):
+        yield row
+
+
+def _ndjson_rows(text_stream):
+    for line in text_stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield None  # Reported as "not valid JSON"
+            continue
+        yield row if isinstance(row, dict) else None
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if not isinstance(value, str):  # NDJSON can send numbers, lists, ...
+        raise ValueError(f'is_completed must be true or false, got {value!r}')
+    text = value.strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f'is_completed must be true or false, got {value!r}')
+
+
+def validate_row(row, user_id):
+    """Returns the values to insert, or raises ValueError with the reason."""
+    if row is None:
+        raise ValueError('not a valid row')
+
+    task_content = row.get('task_content') or ''
+    if not isinstance(task_content, str):  # NDJSON can send numbers, lists, ...
+        raise ValueError('task_content must be text')
+    task_content = task_content.strip()
+    if not task_content:
+        raise ValueError('task_content is required')
+    if len(task_content) > MAX_TASK_LENGTH:
+        raise ValueError(f'task_content is longer than {MAX_TASK_LENGTH} characters')
+
+    return {
+        'task_content': task_content,
+        'is_completed': _parse_bool(row.get('is_completed', False)),
+        'user_id': user_id,
+    }
+
+
+def import_todos(db, todo_model, user_id, stream, content_type):
+    """
+    Reads rows from the binary request stream and inserts the valid ones.
+    Returns a summary: {'accepted': n, 'rejected': n, 'errors': [...]}
+    """
+    text_stream = io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8', newline='')
+    rows = _csv_rows(text_stream) if 'csv' in content_type else _ndjson_rows(text_stream)
+
+    accepted, rejected, errors, batch = 0, 0, [], []
+
+    def flush():
+        if batch:
+            db.session.execute(insert(todo_model), batch)  # One executemany
+            db.session.commit()                             # Short transaction
+            batch.clear()
+
+    line_number = 0
+    try:
+        for line_number, row in enumerate(rows, start=1):
+            try:
+                batch.append(validate_row(row, user_id))
+                accepted += 1
+            except ValueError as e:
+                rejected += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({'row': line_number, 'error': str(e)})
+            if len(batch) >= BATCH_SIZE:
+                flush()
+    except (UnicodeDecodeError, csv.Error) as e:
+        # A broken file: keep what was imported so far and say where it stopped
+        errors.append({'row': line_number + 1, 'error': f'could not read the file: {e}'})
+    flush()
+
+    return {'accepted': accepted, 'rejected': rejected, 'errors': errors}
@@ -1,5 +1,8 @@
 from flask import Flask, request, jsonify, render_template
-from models import db, User, Todo
+from sqlalchemy.exc import IntegrityError
+from models import db, User, Todo, find_registration_conflict, registration_error_message
+from models import create_user_indexes
+# from models import PRIORITIES  # STEP 3: uncomment this import too
 from auth import hash_password, verify_password, create_token, get_current_user
 
 app = Flask(__name__)
@@ -10,6 +13,21 @@ db.init_app(app)
 
 with app.app_context():
     db.create_all()
+    create_user_indexes(db.engine)  # Older todo.db files: case-insensitive uniqueness
+
+
+# ===========================================
+# HOMEWORK (STEP 3): Uncomment this function
+# ===========================================
+# def parse_priority(value):
+#     """
+#     Turns a priority name from the request into its number.
+#     Returns: (number, None) on success, (None, error_response) on failure
+#     """
+#     if not isinstance(value, str) or value not in PRIORITIES:
+#         return None, (jsonify({'error': 'priority must be low, medium or high'}), 400)
+#     return PRIORITIES[value], None
+# ===========================================
 
 
 # ============================================
@@ -41,11 +59,10 @@ def dashboard_page():
 def register():
     data = request.get_json()
 
-    if User.query.filter_by(email=data['email']).first():
-        return jsonify({'error': 'Email already registered'}), 400
-
-    if User.query.filter_by(username=data['username']).first():
-        return jsonify({'error': 'Username already taken'}), 400
+    # ONE cheap query for duplicates, before the expensive password hashing
+    conflict = find_registration_conflict(data['username'], data['email'])
+    if conflict:
+        return jsonify({'error': conflict}), 400
 
     user = User(
         username=data['username'],
@@ -53,8 +70,13 @@ def register():
         password_hash=hash_password(data['password'])
     )
 
+    # The unique indexes catch anyone who registered the same name meanwhile
     db.session.add(user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        return jsonify({'error': registration_error_message(e)}), 400
 
     return jsonify({'message': 'Registration successful'}), 201
 
@@ -63,7 +85,8 @@ def register():
 def login():
     data = request.get_json()
 
-    user = User.query.filter_by(email=data['email']).first()
+    # Emails are case-insensitive (same as registration; uses ix_users_email_lower)
+    user = User.query.filter(db.func.lower(User.email) == data['email'].lower()).first()
 
     if not user or not verify_password(data['password'], user.password_hash):
         return jsonify({'error': 'Invalid email or password'}), 401
@@ -108,14 +131,19 @@ def create_todo():
 
     # Step 2: Create todo
     data = request.get_json()
+
+    # ===========================================
+    # HOMEWORK (STEP 3): Uncomment these lines
+    # ===========================================
+    # priority, error = parse_priority(data.get('priority', 'medium'))
+    # if error:
+    #     return error
+    # ===========================================
+
     todo = Todo(
         task_content=data['task_content'],
         user_id=current_user.id,
-        # ===========================================
-        # HOMEWORK: Add this line below
-        # ===========================================
-        # priority=data.get('priority', 'medium')
-        # ===========================================
+        # priority=priority,  # STEP 3: uncomment this line too
     )
 
     db.session.add(todo)
@@ -1,8 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 
 db = SQLAlchemy()
 
+# Priorities are stored as small numbers (high sorts first); the API uses names
+PRIORITIES = {'low': 1, 'medium': 2, 'high': 3}
+PRIORITY_NAMES = {number: name for name, number in PRIORITIES.items()}
+
 class User(db.Model):
     __tablename__ = 'users'
 
@@ -12,6 +17,12 @@ class User(db.Model):
     password_hash = db.Column(db.String(256), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Case-insensitive uniqueness: "Alice" and "alice" are the same user
+    __table_args__ = (
+        db.Index('ix_users_email_lower', db.func.lower(email), unique=True),
+        db.Index('ix_users_username_lower', db.func.lower(username), unique=True),
+    )
+
     todos = db.relationship('Todo', backref='user', lazy=True)
 
     def to_dict(self):
@@ -35,7 +46,7 @@ class Todo(db.Model):
     # ===========================================
     # STEP 1: Add this line below
     # ===========================================
-    # priority = db.Column(db.String(10), default='medium')
+    # priority = db.Column(db.SmallInteger, default=PRIORITIES['medium'], server_default='2', nullable=False)
     # ===========================================
 
     def to_dict(self):
@@ -48,6 +59,51 @@ class Todo(db.Model):
             # ===========================================
             # STEP 2: Add this line below
             # ===========================================
-            # 'priority': self.priority
+            # 'priority': PRIORITY_NAMES.get(self.priority, 'medium')
             # ===========================================
         }
+
+
+# =============================================================================
+# REGISTRATION HELPERS
+# =============================================================================
+
+# ONE cheap query checks both email and username (case-insensitive), so we
+# never spend CPU on hashing a password for a duplicate registration.
+def find_registration_conflict(username, email):
+    taken = User.query.filter(db.or_(
+        db.func.lower(User.email) == email.lower(),
+        db.func.lower(User.username) == username.lower()
+    )).first()
+    if taken is None:
+        return None
+    if taken.email.lower() == email.lower():
+        return 'Email already registered'
+    return 'Username already taken'
+
+
+# If two people register at the same moment, the unique indexes stop the
+# second INSERT. This turns that IntegrityError into the usual message.
+def registration_error_message(error):
+    if 'email' in str(error.orig):
+        return 'Email already registered'
+    return 'Username already taken'
+
+
+# db.create_all() only creates missing TABLES: a database file from before
+# the lower() indexes existed doesn't have them, and would only catch
+# exact-case duplicates. This adds them (IF NOT EXISTS: cheap on every start).
+USER_INDEXES_SQL = [
+    'CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email_lower ON users (lower(email))',
+    'CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username_lower ON users (lower(username))',
+]
+
+
+def create_user_indexes(engine):
+    for sql in USER_INDEXES_SQL:
+        try:
+            with engine.begin() as conn:
+                conn.exec_driver_sql(sql)
+        except IntegrityError:
+            # Two existing users differ only in case: fix them by hand
+            print(f'Could not create a unique index, duplicate users exist: {sql}')
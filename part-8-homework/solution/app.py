@@ -1,7 +1,10 @@
 # SOLUTION - app.py (completed)
 
 from flask import Flask, request, jsonify, render_template
-from models import db, User, Todo
+from sqlalchemy.exc import IntegrityError
+from models import db, User, Todo, find_registration_conflict, registration_error_message
+from models import create_user_indexes
+from models import PRIORITIES, upgrade_priority_column
 from auth import hash_password, verify_password, create_token, token_required
 
 app = Flask(__name__)
@@ -12,6 +15,21 @@ db.init_app(app)
 
 with app.app_context():
     db.create_all()
+    create_user_indexes(db.engine)  # Older todo.db files: case-insensitive uniqueness
+    upgrade_priority_column(db.engine)  # Old todo.db files: text priority -> number
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def parse_priority(value):
+    """
+    Turns a priority name from the request into its number.
+    Returns: (number, None) on success, (None, error_response) on failure
+    """
+    if not isinstance(value, str) or value not in PRIORITIES:
+        return None, (jsonify({'error': 'priority must be low, medium or high'}), 400)
+    return PRIORITIES[value], None
 
 
 # ============================================
@@ -43,11 +61,10 @@ def dashboard_page():
 def register():
     data = request.get_json()
 
-    if User.query.filter_by(email=data['email']).first():
-        return jsonify({'error': 'Email already registered'}), 400
-
-    if User.query.filter_by(username=data['username']).first():
-        return jsonify({'error': 'Username already taken'}), 400
+    # ONE cheap query for duplicates, before the expensive password hashing
+    conflict = find_registration_conflict(data['username'], data['email'])
+    if conflict:
+        return jsonify({'error': conflict}), 400
 
     user = User(
         username=data['username'],
@@ -55,8 +72,13 @@ def register():
         password_hash=hash_password(data['password'])
     )
 
+    # The unique indexes catch anyone who registered the same name meanwhile
     db.session.add(user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        return jsonify({'error': registration_error_message(e)}), 400
 
     return jsonify({'message': 'Registration successful'}), 201
 
@@ -65,7 +87,8 @@ def register():
 def login():
     data = request.get_json()
 
-    user = User.query.filter_by(email=data['email']).first()
+    # Emails are case-insensitive (same as registration; uses ix_users_email_lower)
+    user = User.query.filter(db.func.lower(User.email) == data['email'].lower()).first()
 
     if not user or not verify_password(data['password'], user.password_hash):
         return jsonify({'error': 'Invalid email or password'}), 401
@@ -90,8 +113,29 @@ def login():
 @app.route('/api/todos', methods=['GET'])
 @token_required
 def get_todos(current_user):
-    todos = Todo.query.filter_by(user_id=current_user.id).all()
-    return jsonify({'todos': [todo.to_dict() for todo in todos]})
+    if request.args.get('sort') != 'priority':
+        todos = Todo.query.filter_by(user_id=current_user.id).all()
+        return jsonify({'todos': [todo.to_dict() for todo in todos]})
+
+    # ?sort=priority: high first, newest first, one page at a time.
+    # ?after=<priority>|<id> (next_cursor of the last page) starts right after
+    # that todo, so SQLite reads the next rows of ix_todos_user_priority.
+    limit = max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    query = Todo.query.filter_by(user_id=current_user.id)
+    if request.args.get('after'):
+        try:
+            priority, last_id = (int(part) for part in request.args['after'].split('|'))
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(Todo.priority <= priority,
+                             db.or_(Todo.priority < priority, Todo.id < last_id))
+    todos = query.order_by(Todo.priority.desc(), Todo.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(todos) > limit:  # One extra row: there is another page
+        todos = todos[:limit]
+        next_cursor = f'{todos[-1].priority}|{todos[-1].id}'
+    return jsonify({'todos': [todo.to_dict() for todo in todos], 'next_cursor': next_cursor})
 
 
 @app.route('/api/todos', methods=['POST'])
@@ -99,11 +143,15 @@ def get_todos(current_user):
 def create_todo(current_user):
     data = request.get_json()
 
+    # STEP 3: Added priority (the name is stored as its number)
+    priority, error = parse_priority(data.get('priority', 'medium'))
+    if error:
+        return error
+
     todo = Todo(
         task_content=data['task_content'],
         user_id=current_user.id,
-        # STEP 3: Added priority
-        priority=data.get('priority', 'medium')
+        priority=priority
     )
 
     db.session.add(todo)
@@ -125,6 +173,11 @@ def update_todo(current_user, todo_id):
         todo.task_content = data['task_content']
     if 'is_completed' in data:
         todo.is_completed = data['is_completed']
+    if 'priority' in data:
+        priority, error = parse_priority(data['priority'])
+        if error:
+            return error
+        todo.priority = priority
 
     db.session.commit()
     return jsonify(todo.to_dict())
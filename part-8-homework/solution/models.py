@@ -1,10 +1,16 @@
 # SOLUTION - models.py (completed)
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 
 db = SQLAlchemy()
 
+# Priorities are stored as small numbers, so SQL can sort them (high first)
+# and the index stays narrow. The API still speaks in names.
+PRIORITIES = {'low': 1, 'medium': 2, 'high': 3}
+PRIORITY_NAMES = {number: name for name, number in PRIORITIES.items()}
+
 class User(db.Model):
     __tablename__ = 'users'
 
@@ -14,6 +20,12 @@ class User(db.Model):
     password_hash = db.Column(db.String(256), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Case-insensitive uniqueness: "Alice" and "alice" are the same user
+    __table_args__ = (
+        db.Index('ix_users_email_lower', db.func.lower(email), unique=True),
+        db.Index('ix_users_username_lower', db.func.lower(username), unique=True),
+    )
+
     todos = db.relationship('Todo', backref='user', lazy=True)
 
     def to_dict(self):
@@ -34,8 +46,14 @@ class Todo(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
 
-    # STEP 1: Added priority column
-    priority = db.Column(db.String(10), default='medium')
+    # STEP 1: Added priority column (1 = low, 2 = medium, 3 = high)
+    priority = db.Column(db.SmallInteger, default=PRIORITIES['medium'],
+                         server_default='2', nullable=False)
+
+    # A user's todos by priority: GET /api/todos?sort=priority reads this index in order
+    __table_args__ = (
+        db.Index('ix_todos_user_priority', 'user_id', 'priority', 'id'),
+    )
 
     def to_dict(self):
         return {
@@ -44,6 +62,77 @@ class Todo(db.Model):
             'is_completed': self.is_completed,
             'created_at': self.created_at.isoformat(),
             'user_id': self.user_id,
-            # STEP 2: Added priority to dict
-            'priority': self.priority
+            # STEP 2: Added priority to dict (as its name)
+            'priority': PRIORITY_NAMES.get(self.priority, 'medium')
         }
+
+
+# =============================================================================
+# REGISTRATION HELPERS
+# =============================================================================
+
+# ONE cheap query checks both email and username (case-insensitive), so we
+# never spend CPU on hashing a password for a duplicate registration.
+def find_registration_conflict(username, email):
+    taken = User.query.filter(db.or_(
+        db.func.lower(User.email) == email.lower(),
+        db.func.lower(User.username) == username.lower()
+    )).first()
+    if taken is None:
+        return None
+    if taken.email.lower() == email.lower():
+        return 'Email already registered'
+    return 'Username already taken'
+
+
+# If two people register at the same moment, the unique indexes stop the
+# second INSERT. This turns that IntegrityError into the usual message.
+def registration_error_message(error):
+    if 'email' in str(error.orig):
+        return 'Email already registered'
+    return 'Username already taken'
+
+
+# db.create_all() only creates missing TABLES: a database file from before
+# the lower() indexes existed doesn't have them, and would only catch
+# exact-case duplicates. This adds them (IF NOT EXISTS: cheap on every start).
+USER_INDEXES_SQL = [
+    'CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email_lower ON users (lower(email))',
+    'CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username_lower ON users (lower(username))',
+]
+
+
+def create_user_indexes(engine):
+    for sql in USER_INDEXES_SQL:
+        try:
+            with engine.begin() as conn:
+                conn.exec_driver_sql(sql)
+        except IntegrityError:
+            # Two existing users differ only in case: fix them by hand
+            print(f'Could not create a unique index, duplicate users exist: {sql}')
+
+
+# =============================================================================
+# MIGRATION: priority as text -> priority as a number
+# =============================================================================
+
+# db.create_all() only creates missing tables. A todo.db from before this
+# change has priority as text ('low', 'medium', 'high') or no priority at all;
+# this converts it in place, in one transaction, so nobody has to delete it.
+def upgrade_priority_column(engine):
+    with engine.begin() as conn:
+        columns = {row[1]: row[2] for row in conn.exec_driver_sql('PRAGMA table_info(todos)')}
+        if columns.get('priority', '').upper() == 'SMALLINT':
+            return  # Already a number
+
+        if 'priority' in columns:
+            conn.exec_driver_sql('ALTER TABLE todos RENAME COLUMN priority TO priority_text')
+        conn.exec_driver_sql('ALTER TABLE todos ADD COLUMN priority SMALLINT NOT NULL DEFAULT 2')
+        if 'priority' in columns:
+            conn.exec_driver_sql(
+                "UPDATE todos SET priority = CASE lower(priority_text) "
+                "WHEN 'low' THEN 1 WHEN 'high' THEN 3 ELSE 2 END"
+            )
+            conn.exec_driver_sql('ALTER TABLE todos DROP COLUMN priority_text')
+        conn.exec_driver_sql(
+            'CREATE INDEX IF NOT EXISTS ix_todos_user_priority ON todos (user_id, priority, id)')